@@ -0,0 +1,70 @@
+import argparse
+import statistics
+import sys
+import threading
+
+from common import add_report_arguments, write_report
+
+from ApiClient import ApiClient, RequestTiming
+from MockCompletionServer import serve
+
+MESSAGES = [{"role": "user", "content": "Say hello."}]
+
+
+def run(api_base, requests, reuse, stream):
+    client = ApiClient("mock", api_base) if reuse else None
+    timings = []
+    for _ in range(requests):
+        if not reuse:
+            client = ApiClient("mock", api_base)
+        timing = RequestTiming()
+        response = client.chat_completion(
+            MESSAGES, "gpt-3.5-turbo", 0.6, stream=stream, timing=timing
+        )
+        if stream:
+            for _ in response:
+                pass
+        timings.append(timing)
+        if not reuse:
+            client.close()
+    return timings
+
+
+def medians(name, timings):
+    reused = sum(1 for timing in timings if timing.reused)
+    print(f"{name}: reused connections {reused}/{len(timings)}", file=sys.stderr)
+    return {
+        f"client/{name}/{field}_median": statistics.median(
+            getattr(timing, field) for timing in timings
+        )
+        * 1000
+        for field in ("connect", "first_byte", "total")
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Per-request timing with and without a pooled session."
+    )
+    add_report_arguments(parser, "benchmark_results_client.json")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument(
+        "--api-base",
+        help="Endpoint to time against; a local mock server is started if omitted.",
+    )
+    parser.add_argument("--stream", action="store_true")
+    args = parser.parse_args()
+    api_base = args.api_base
+    if api_base is None:
+        server = serve(port=0, first_token_delay=0, token_delay=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        api_base = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    results = medians("new_session", run(api_base, args.requests, False, args.stream))
+    results.update(medians("pooled", run(api_base, args.requests, True, args.stream)))
+    write_report(
+        args,
+        results,
+        requests=args.requests,
+        api_base=args.api_base,
+        stream=args.stream,
+    )
@@ -0,0 +1,85 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+
+
+def median_ms(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def unit(name):
+    # Results are milliseconds, apart from sizes, which say so in their name.
+    return "MB" if name.endswith("_mb") else "ms"
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=SRC,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def add_report_arguments(parser, output):
+    parser.add_argument("-o", "--output", default=output)
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="Percent slowdown reported as a regression",
+    )
+
+
+def compare(baseline, results, threshold):
+    print(f"{'benchmark':<44}{'baseline':>12}{'now':>12}{'change':>9}")
+    for name, value in results.items():
+        old = baseline.get(name)
+        if old is None:
+            print(f"{name:<44}{'-':>12}{value:>10.3f}{unit(name)}")
+            continue
+        change = (value - old) / old * 100 if old else 0.0
+        flag = "  worse" if change > threshold else ""
+        print(
+            f"{name:<44}{old:>10.3f}{unit(name)}{value:>10.3f}{unit(name)}"
+            f"{change:>+8.1f}%{flag}"
+        )
+
+
+def write_report(args, results, **settings):
+    # Written with the commit and the settings that change the numbers, so
+    # runs can be compared later with --baseline.
+    report = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        **settings,
+        "unit": "ms",
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            compare(json.load(file)["results"], results, args.threshold)
+    else:
+        for name, value in results.items():
+            print(f"{name:<44}{value:>10.3f} {unit(name)}")
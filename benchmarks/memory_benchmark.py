@@ -0,0 +1,196 @@
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+
+from common import add_report_arguments, median_ms, write_report
+
+from Conversation import Conversation, Turn
+from InterfaceUtility import SYSTEM_PROMPT, TEMPERATURE, ChatModel
+from RawHistory import RawHistoryModel, summarize
+from ResponseCache import cache_key
+from TokenCounter import message_tokens
+
+PARAGRAPH = (
+    "Open the file with a `with` block and iterate over it; iterating the file "
+    "object reads one line at a time, so memory use stays flat even for very "
+    "large files. "
+)
+TOKEN_BUDGET = 4096
+
+
+def make_turns(count):
+    # Every turn gets its own text, as in a real conversation.
+    turns = []
+    for turn_id in range(1, count + 1):
+        prompt = f"How do I read file number {turn_id} line by line?"
+        response = f"For file {turn_id}: " + PARAGRAPH * 8
+        raw = json.dumps(
+            {
+                "id": f"chatcmpl-{turn_id}",
+                "object": "chat.completion",
+                "created": 1700000000 + turn_id,
+                "model": "gpt-3.5-turbo",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": response},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 31,
+                    "completion_tokens": 58,
+                    "total_tokens": 89,
+                },
+            }
+        )
+        turns.append((turn_id, prompt, response, raw, 15, 200))
+    return turns
+
+
+def legacy_state(turns):
+    # What a conversation used to hold: parallel lists and each raw response
+    # as JSON including the reply text. Rendered turns live in the chat
+    # document either way, so they are left out of both layouts.
+    state = {
+        "turn_ids": [],
+        "input_text_list": [],
+        "assistant_response": [],
+        "input_token_counts": [],
+        "response_token_counts": [],
+        "raw_history": [],
+    }
+    for turn_id, prompt, response, raw, prompt_tokens, response_tokens in turns:
+        state["turn_ids"].append(turn_id)
+        state["input_text_list"].append(prompt)
+        state["assistant_response"].append(response)
+        state["input_token_counts"].append(prompt_tokens)
+        state["response_token_counts"].append(response_tokens)
+        record = json.loads(raw)
+        state["raw_history"].append(
+            (summarize(record), json.dumps(record, separators=(",", ":")))
+        )
+    return state
+
+
+def compact_state(turns):
+    conversation = Conversation()
+    history = RawHistoryModel()
+    conversation.prepend(
+        [
+            Turn(turn_id, prompt, response, prompt_tokens, response_tokens)
+            for turn_id, prompt, response, _, prompt_tokens, response_tokens in turns
+        ]
+    )
+    for turn, (_, _, _, raw, _, _) in zip(conversation.records, turns):
+        history.append(raw, turn.response)
+    return conversation, history
+
+
+def traced(build, turns):
+    gc.collect()
+    tracemalloc.start()
+    state = build(turns)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return state, size
+
+
+def legacy_messages(
+    prompts, responses, token_budget=None, prompt_tokens=None, response_tokens=None
+):
+    # The selection the app made from its parallel lists: with a budget, whole
+    # user/assistant pairs, newest first, while they fit.
+    first = 0
+    if token_budget:
+        first = len(prompts) - 1
+        used = 3 + message_tokens("system", SYSTEM_PROMPT) + prompt_tokens[first]
+        while first > 0:
+            cost = prompt_tokens[first - 1] + response_tokens[first - 1]
+            if used + cost > token_budget:
+                break
+            used += cost
+            first -= 1
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    for index in range(first, len(prompts)):
+        messages.append({"role": "user", "content": prompts[index]})
+        if index < len(prompts) - 1:
+            messages.append({"role": "assistant", "content": responses[index]})
+    return messages
+
+
+def legacy_request(state, prompt, token_budget=None, window=10):
+    # Every request copied the lists, built fresh message dicts and encoded
+    # the whole context twice: for the request body and the cache key.
+    prompts = state["input_text_list"] + [prompt]
+    prompt_tokens = state["input_token_counts"] + [message_tokens("user", prompt)]
+    if token_budget:
+        messages = legacy_messages(
+            prompts,
+            state["assistant_response"],
+            token_budget,
+            prompt_tokens,
+            state["response_token_counts"],
+        )
+    else:
+        messages = legacy_messages(
+            prompts[-window:], state["assistant_response"][-(window - 1) :]
+        )
+    payload = {
+        "model": "gpt-3.5-turbo",
+        "messages": messages,
+        "temperature": TEMPERATURE,
+    }
+    body = json.dumps(payload)
+    key = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return body, key
+
+
+def compact_request(conversation, prompt, token_budget=None, window=10):
+    from ApiClient import encode_payload
+
+    conversation.ask(prompt, message_tokens("user", prompt))
+    messages = ChatModel().turn_context(conversation, token_budget, window)
+    body = encode_payload(
+        {"model": "gpt-3.5-turbo", "messages": messages, "temperature": TEMPERATURE}
+    )
+    key = cache_key("gpt-3.5-turbo", messages, TEMPERATURE)
+    conversation.retract()
+    return body, key
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Memory held per conversation and per-request payload cost."
+    )
+    add_report_arguments(parser, "benchmark_results_memory.json")
+    parser.add_argument("--turns", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    turns = make_turns(args.turns)
+    legacy, legacy_size = traced(legacy_state, turns)
+    (conversation, history), compact_size = traced(compact_state, turns)
+    # The prompt and reply strings themselves are held either way.
+    text_size = sum(
+        sys.getsizeof(prompt) + sys.getsizeof(response)
+        for _, prompt, response, _, _, _ in turns
+    )
+    results = {
+        "memory/text_mb": text_size / 1e6,
+        "memory/lists_mb": (legacy_size + text_size) / 1e6,
+        "memory/turn_records_mb": (compact_size + text_size) / 1e6,
+    }
+
+    prompt = "And how do I skip blank lines?"
+    for name, budget in (("window_10", None), ("budget_4096", TOKEN_BUDGET)):
+        results[f"request/{name}/lists"] = median_ms(
+            lambda: legacy_request(legacy, prompt, budget), args.repeat
+        )
+        results[f"request/{name}/turn_records"] = median_ms(
+            lambda: compact_request(conversation, prompt, budget), args.repeat
+        )
+    write_report(args, results, turns=args.turns, repeat=args.repeat)
@@ -0,0 +1,286 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from common import add_report_arguments, median_ms, write_report
+
+PARAGRAPH = (
+    "The quick brown fox jumps over the lazy dog. Pack my box with five dozen "
+    "liquor jugs! def main(argv):\n    return sum(int(x) ** 2 for x in argv)\n\n"
+)
+RESPONSE = (
+    "Open the file with a `with` block and iterate over it:\n\n"
+    "    with open(path) as file:\n"
+    "        for line in file:\n"
+    "            print(line.rstrip())\n\n"
+    "Iterating the file object reads one line at a time, so memory use stays "
+    "flat even for very large files."
+)
+USAGE = "Completion tokens: 58\tPrompt tokens: 31\nTotal tokens: 89\n"
+SIZES = [
+    ("1KB", 1 << 10),
+    ("10KB", 10 << 10),
+    ("100KB", 100 << 10),
+    ("1MB", 1 << 20),
+]
+GROUPS = [
+    "token_count",
+    "context",
+    "prepared_context",
+    "parse_response",
+    "submit",
+    "startup",
+]
+
+
+def text_of_size(size):
+    return (PARAGRAPH * (size // len(PARAGRAPH) + 1))[:size]
+
+
+def spin(app, done, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while not done():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("benchmark step did not finish")
+        app.processEvents()
+        time.sleep(0.0005)
+
+
+def bench_token_count(app, quick):
+    # What the counter under the input box does: a full count when text is
+    # first pasted, then a recount after each small edit.
+    from TokenCounter import TokenCounter
+
+    results = {}
+    sizes = SIZES if quick else SIZES + [("5MB", 5 << 20)]
+    for name, size in sizes:
+        text = text_of_size(size)
+        middle = size // 2
+        edited = f"{text[:middle]} word{text[middle:]}"
+        repeat = 3 if size > 1 << 20 else 10
+        results[f"token_count/first/{name}"] = median_ms(
+            lambda: TokenCounter().count(text), repeat
+        )
+        counter = TokenCounter()
+        counter.count(text)
+        versions = itertools.cycle([edited, text])
+        results[f"token_count/edit/{name}"] = median_ms(
+            lambda: counter.count(next(versions)), repeat * 10
+        )
+    return results
+
+
+def make_conversation(turns):
+    from Conversation import Conversation, Turn
+    from TokenCounter import message_tokens
+
+    conversation = Conversation()
+    conversation.prepend(
+        [
+            Turn(
+                turn,
+                f"{PARAGRAPH} ({turn})",
+                RESPONSE,
+                message_tokens("user", f"{PARAGRAPH} ({turn})"),
+                message_tokens("assistant", RESPONSE),
+            )
+            for turn in range(1, turns)
+        ]
+    )
+    prompt = f"{PARAGRAPH} ({turns})"
+    conversation.ask(prompt, message_tokens("user", prompt))
+    return conversation
+
+
+def bench_context(app, quick):
+    from InterfaceUtility import ChatModel
+
+    turns = 100 if quick else 1000
+    conversation = make_conversation(turns)
+    chat_model = ChatModel()
+    return {
+        f"context/window_10/{turns}_turns": median_ms(
+            lambda: chat_model.turn_context(conversation, window=10), 200
+        ),
+        f"context/budget_4096/{turns}_turns": median_ms(
+            lambda: chat_model.turn_context(conversation, 4096), 200
+        ),
+    }
+
+
+def bench_prepared_context(app, quick):
+    # The split used by the window: the context is prepared while the user is
+    # typing, and submitting only packs the prompt next to it.
+    from InterfaceUtility import ChatModel
+
+    turns = 100 if quick else 1000
+    conversation = make_conversation(turns)
+    chat_model = ChatModel()
+    end = conversation.saved
+
+    def prepare():
+        context = chat_model.prepare_context(conversation, 4096, end=end)
+        context.encode()
+        return context
+
+    context = prepare()
+    return {
+        f"prepared_context/prepare/{turns}_turns": median_ms(prepare, 200),
+        f"prepared_context/submit/{turns}_turns": median_ms(
+            lambda: context.messages(conversation.last), 200
+        ),
+    }
+
+
+def bench_parse_response(app, quick):
+    from main import MainWindow
+
+    window = MainWindow()
+    # Hidden conversation tabs defer rendering, so the window has to be shown.
+    window.show()
+    conversation = window.conversation
+    checkpoints = [10, 100] if quick else [10, 100, 1000]
+    timings = []
+    for turn in range(checkpoints[-1]):
+        conversation.turns.ask(f"How do I read a file line by line? ({turn})", 0)
+        conversation.turns.last.answer(RESPONSE, 0)
+        started = time.perf_counter()
+        conversation.parse_response(None, USAGE)
+        timings.append(time.perf_counter() - started)
+    window.close()
+    return {
+        f"parse_response/turn_{checkpoint}": statistics.mean(
+            timings[checkpoint - 10 : checkpoint]
+        )
+        * 1000
+        for checkpoint in checkpoints
+    }
+
+
+def bench_submit(app, quick):
+    # Zero server delays, so what is left is the app's own overhead around a
+    # streamed request: building the context, the worker thread, rendering
+    # and saving the turn.
+    import openai
+
+    from main import MainWindow
+    from MockCompletionServer import serve
+
+    server = serve(port=0, first_token_delay=0, token_delay=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    openai.api_base = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    window = MainWindow()
+    window.OPENAI_API_KEY = "mock"
+    window.show()
+    conversation = window.conversation
+    latencies, first_tokens, sent = [], [], []
+    # The window prints every response; keep that out of the report.
+    with contextlib.redirect_stdout(io.StringIO()):
+        for turn in range(10 if quick else 50):
+            conversation.input_text_edit.setPlainText(f"Question number {turn}")
+            answered = conversation.turns.saved + 1
+            started = time.perf_counter()
+            conversation.submit_text()
+            spin(
+                app,
+                lambda: conversation.turns.saved == answered
+                and conversation.task is None,
+            )
+            latencies.append(time.perf_counter() - started)
+            first_tokens.append(conversation.first_token_time)
+            timing = conversation.request_timing
+            sent.append(timing.sent_at - conversation.submit_started)
+    window.close()
+    server.shutdown()
+    latencies.sort()
+    return {
+        "submit/latency_median": statistics.median(latencies) * 1000,
+        "submit/latency_p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "submit/first_token_median": statistics.median(first_tokens) * 1000,
+        "submit/sent_median": statistics.median(sent) * 1000,
+    }
+
+
+def startup_probe():
+    # Run in a fresh interpreter so module imports are part of the timing.
+    from Startup import StartupTimer
+
+    startup = StartupTimer()
+    from PySide6.QtWidgets import QApplication
+
+    app = QApplication([])
+    from main import MainWindow
+
+    window = MainWindow()
+    window.show()
+    window.finish_startup(startup)
+    spin(app, lambda: window.warmup_worker is None)
+    window.close()
+    print(
+        json.dumps(
+            {
+                "window_shown": startup.elapsed("window shown") * 1000,
+                "ready": startup.elapsed("ready") * 1000,
+            }
+        )
+    )
+
+
+def bench_startup(app, quick):
+    runs = []
+    for _ in range(3 if quick else 5):
+        with tempfile.TemporaryDirectory() as directory:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--startup-probe"],
+                cwd=directory,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        f"startup/{step}": statistics.median(run[step] for run in runs)
+        for step in ("window_shown", "ready")
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the chat pipeline's hot paths and write the results as JSON."
+    )
+    add_report_arguments(parser, "benchmark_results.json")
+    parser.add_argument("--groups", nargs="+", choices=GROUPS, default=GROUPS)
+    parser.add_argument(
+        "--quick", action="store_true", help="Smaller inputs and fewer runs"
+    )
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.startup_probe:
+        startup_probe()
+        sys.exit(0)
+
+    from PySide6.QtWidgets import QApplication
+
+    app = QApplication(sys.argv)
+    results = {}
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        # The main window saves turns to conversations.db in the working
+        # directory; keep that out of the real one.
+        os.chdir(directory)
+        for group in args.groups:
+            print(f"running {group}...", file=sys.stderr)
+            results.update(globals()[f"bench_{group}"](app, args.quick))
+        os.chdir(working_directory)
+    write_report(args, results, quick=args.quick)
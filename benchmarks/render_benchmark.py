@@ -0,0 +1,80 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from common import add_report_arguments, write_report
+
+import markdown2
+from PySide6.QtGui import QTextCursor
+from PySide6.QtWidgets import QApplication, QTextBrowser
+
+from ChatRenderer import ChatRenderer
+
+PROMPT = "How do I read a file line by line in Python?"
+RESPONSE = (
+    "Open the file with a `with` block and iterate over it:\n\n"
+    "    with open(path) as file:\n"
+    "        for line in file:\n"
+    "            print(line.rstrip())\n\n"
+    "Iterating the file object reads one line at a time, so memory use stays "
+    "flat even for very large files."
+)
+USAGE = "Completion tokens: 58\tPrompt tokens: 31\nTotal tokens: 89\n"
+
+
+def legacy_render(browser, prompt, response, token_usage):
+    markdown = browser.toMarkdown() if browser.toMarkdown() else ""
+    markdown = markdown + ChatRenderer.turn_markdown(prompt, response, token_usage)
+    browser.setHtml(markdown2.markdown(markdown))
+    browser.moveCursor(QTextCursor.End)
+
+
+def run(turns, legacy=False):
+    browser = QTextBrowser()
+    renderer = ChatRenderer(browser)
+    timings = []
+    for turn in range(turns):
+        prompt = f"{PROMPT} ({turn})"
+        started = time.perf_counter()
+        if legacy:
+            legacy_render(browser, prompt, RESPONSE, USAGE)
+        else:
+            renderer.append_turn(prompt, RESPONSE, USAGE)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def per_turn(name, timings, window=10):
+    # Mean over the turns just before each checkpoint, as each turn costs more
+    # the longer the transcript gets.
+    return {
+        f"render/{name}/turn_{checkpoint}": statistics.mean(
+            timings[max(checkpoint - window, 0) : checkpoint]
+        )
+        * 1000
+        for checkpoint in (10, 100, 1000)
+        if checkpoint <= len(timings)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-turn chat render time.")
+    add_report_arguments(parser, "benchmark_results_render.json")
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument(
+        "--legacy-turns",
+        type=int,
+        default=0,
+        help="Also time the old whole-transcript renderer for this many turns.",
+    )
+    args = parser.parse_args()
+    app = QApplication(sys.argv)
+    results = per_turn("append", run(args.turns))
+    if args.legacy_turns:
+        legacy = run(args.legacy_turns, legacy=True)
+        results.update(per_turn("whole_transcript", legacy))
+    write_report(args, results, turns=args.turns, legacy_turns=args.legacy_turns)
@@ -0,0 +1,48 @@
+import argparse
+import random
+import statistics
+import time
+
+from common import add_report_arguments, write_report
+
+from TurnIndex import TurnIndex
+
+WORDS = [f"word{i}" for i in range(20000)]
+QUERIES = [
+    "how do I read a large file line by line",
+    "word12 word345 word6789",
+    "why does my thread pool deadlock when the queue is full and a worker raises",
+]
+
+
+def build(turns, seed=1):
+    rng = random.Random(seed)
+    index = TurnIndex()
+    for turn_id in range(1, turns + 1):
+        index.add(turn_id, rng.randint(50, 600), " ".join(rng.choices(WORDS, k=120)))
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Top-k turn retrieval time.")
+    add_report_arguments(parser, "benchmark_results_retrieval.json")
+    parser.add_argument("--turns", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    index = build(args.turns)
+    results = {
+        "retrieval/embed": (time.perf_counter() - started) * 1000,
+        "retrieval/vectors_mb": index.vectors[:, : len(index)].nbytes / 1e6,
+    }
+    for query in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            index.select(query)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        name = f"retrieval/select/{len(query.split())}_words"
+        results[f"{name}_median"] = statistics.median(timings) * 1000
+        results[f"{name}_p95"] = timings[int(len(timings) * 0.95) - 1] * 1000
+    write_report(args, results, turns=args.turns, repeat=args.repeat)
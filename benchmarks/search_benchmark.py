@@ -0,0 +1,50 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from common import add_report_arguments, median_ms, write_report
+
+from ConversationStore import ConversationStore
+
+WORDS = [f"word{i}" for i in range(5000)] + ["python", "file", "thread", "socket"]
+QUERIES = ["python", "python file", "thread socket", "wor", "word12", "missing"]
+
+
+def fill(store, turns, seed=1):
+    rng = random.Random(seed)
+    session_id = store.create_session("benchmark")
+    with store.connection:
+        store.connection.executemany(
+            "INSERT INTO turns (session_id, prompt, response, token_usage, raw,"
+            " prompt_tokens, response_tokens, created)"
+            " VALUES (?, ?, ?, '', '{}', 0, 0, 0)",
+            (
+                (
+                    session_id,
+                    " ".join(rng.choices(WORDS, k=20)),
+                    " ".join(rng.choices(WORDS, k=150)),
+                )
+                for _ in range(turns)
+            ),
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full-text search query time.")
+    add_report_arguments(parser, "benchmark_results_search.json")
+    parser.add_argument("--turns", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        store = ConversationStore(os.path.join(directory, "conversations.db"))
+        started = time.perf_counter()
+        fill(store, args.turns)
+        results = {"search/index": (time.perf_counter() - started) * 1000}
+        for query in QUERIES:
+            results[f"search/query/{query.replace(' ', '_')}"] = median_ms(
+                lambda: store.search(query), args.repeat
+            )
+        store.close()
+    write_report(args, results, turns=args.turns, repeat=args.repeat)
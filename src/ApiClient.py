@@ -0,0 +1,258 @@
+import json
+import os
+import threading
+import time
+
+import openai
+import requests
+from openai.openai_object import OpenAIObject
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from Conversation import encode_messages
+
+CONNECT_TIMEOUT = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", 10))
+READ_TIMEOUT = float(os.environ.get("OPENAI_READ_TIMEOUT", 600))
+# Servers drop idle keep-alive connections; one idle for longer than this is
+# re-checked before the next request rather than trusted.
+WARM_AFTER_IDLE = float(os.environ.get("OPENAI_WARM_AFTER_IDLE", 30))
+
+# Time spent opening connections (TCP and TLS) by the current thread, so a
+# request can tell whether it reused a pooled connection.
+connect_time = threading.local()
+# When the current thread last finished writing a request to the socket.
+request_sent = threading.local()
+
+
+def add_connect_time(seconds):
+    connect_time.value = getattr(connect_time, "value", 0.0) + seconds
+
+
+class TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        add_connect_time(time.perf_counter() - started)
+
+    def request(self, *args, **kwargs):
+        super().request(*args, **kwargs)
+        request_sent.value = time.perf_counter()
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        add_connect_time(time.perf_counter() - started)
+
+    def request(self, *args, **kwargs):
+        super().request(*args, **kwargs)
+        request_sent.value = time.perf_counter()
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+
+class RequestTiming:
+    # sent_at is a time.perf_counter() reading, for comparing with when the
+    # request was submitted; the rest are durations.
+    __slots__ = ("connect", "first_byte", "total", "reused", "sent_at")
+
+    def __init__(self):
+        self.connect = None
+        self.first_byte = None
+        self.total = None
+        self.reused = None
+        self.sent_at = None
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def summary(self):
+        parts = []
+        if self.connect is not None:
+            parts.append(
+                "Connect: reused" if self.reused else f"Connect: {self.connect * 1000:.0f} ms"
+            )
+        if self.first_byte is not None:
+            parts.append(f"First byte: {self.first_byte * 1000:.0f} ms")
+        if self.total is not None:
+            parts.append(f"Total: {self.total * 1000:.0f} ms")
+        return "\t".join(parts)
+
+
+def encode_payload(payload):
+    # The history is the bulk of every request body; messages that were sent
+    # before reuse their cached JSON instead of being encoded again.
+    if "messages" not in payload:
+        return json.dumps(payload)
+    fields = {key: value for key, value in payload.items() if key != "messages"}
+    messages = encode_messages(payload["messages"])
+    return f'{json.dumps(fields)[:-1]}, "messages": {messages}}}'
+
+
+def raise_for_error(response):
+    try:
+        body = response.json()
+        message = body.get("error", {}).get("message", response.text)
+        code = body.get("error", {}).get("code")
+    except ValueError:
+        body = None
+        message = response.text
+        code = None
+    error_class = {
+        401: openai.error.AuthenticationError,
+        403: openai.error.PermissionError,
+        404: openai.error.InvalidRequestError,
+        429: openai.error.RateLimitError,
+    }.get(response.status_code)
+    details = dict(
+        http_body=response.text,
+        http_status=response.status_code,
+        json_body=body,
+        headers=response.headers,
+        code=code,
+    )
+    if error_class is openai.error.InvalidRequestError:
+        raise error_class(message, None, **details)
+    if error_class is None:
+        error_class = (
+            openai.error.ServiceUnavailableError
+            if response.status_code == 503
+            else openai.error.APIError
+        )
+    raise error_class(message, **details)
+
+
+class ApiClient:
+    def __init__(
+        self,
+        api_key,
+        api_base=None,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        pool_size=16,
+    ):
+        self.api_key = api_key
+        self.api_base = (api_base or openai.api_base).rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.lock = threading.Lock()
+        self.last_used = float("-inf")
+        self.warming = False
+        self.session = requests.Session()
+        adapter = TimedAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+                "Connection": "keep-alive",
+            }
+        )
+
+    def start_warming(self):
+        # Claims the warm-up, so typing does not queue one per keystroke.
+        with self.lock:
+            if self.warming or time.monotonic() - self.last_used < WARM_AFTER_IDLE:
+                return False
+            self.warming = True
+            return True
+
+    def warm(self):
+        # Any cheap request opens the connection (TCP and TLS) and leaves it
+        # in the pool for the completion that follows; the answer is unused.
+        try:
+            self.session.get(f"{self.api_base}/models", timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            pass
+        finally:
+            with self.lock:
+                self.warming = False
+                self.last_used = time.monotonic()
+
+    def post(self, path, payload, timing, stream=False):
+        connect_time.value = 0.0
+        request_sent.value = None
+        self.last_used = time.monotonic()
+        started = time.perf_counter()
+        try:
+            response = self.session.post(
+                f"{self.api_base}{path}",
+                data=encode_payload(payload),
+                stream=stream,
+                timeout=self.timeout,
+            )
+        except requests.exceptions.Timeout as e:
+            raise openai.error.Timeout(f"Request timed out: {e}") from e
+        except requests.exceptions.RequestException as e:
+            raise openai.error.APIConnectionError(f"Error communicating with API: {e}") from e
+        timing.first_byte = time.perf_counter() - started
+        timing.sent_at = request_sent.value
+        timing.connect = connect_time.value
+        timing.reused = connect_time.value == 0.0
+        if response.status_code >= 400:
+            timing.total = time.perf_counter() - started
+            raise_for_error(response)
+        return response, started
+
+    def chat_completion(
+        self, messages, model, temperature, stream=False, timing=None, **params
+    ):
+        timing = timing if timing is not None else RequestTiming()
+        payload = dict(
+            model=model, messages=messages, temperature=temperature, stream=stream, **params
+        )
+        response, started = self.post("/chat/completions", payload, timing, stream)
+        if not stream:
+            result = OpenAIObject.construct_from(response.json())
+            timing.total = time.perf_counter() - started
+            self.last_used = time.monotonic()
+            return result
+        return self.iter_events(response, started, timing)
+
+    def iter_events(self, response, started, timing):
+        # Read the stream to the end, even past [DONE], so the connection goes
+        # back to the pool instead of being dropped.
+        try:
+            for line in response.iter_lines():
+                if not line.startswith(b"data: "):
+                    continue
+                data = line[len(b"data: ") :]
+                if data == b"[DONE]":
+                    continue
+                yield OpenAIObject.construct_from(json.loads(data))
+        finally:
+            response.close()
+            timing.total = time.perf_counter() - started
+            self.last_used = time.monotonic()
+
+    def close(self):
+        self.session.close()
+
+
+clients = {}
+clients_lock = threading.Lock()
+
+
+def get_client(api_key):
+    with clients_lock:
+        client = clients.get(api_key)
+        if client is None:
+            client = clients[api_key] = ApiClient(api_key)
+        return client
@@ -0,0 +1,196 @@
+import mmap
+import os
+
+from PySide6.QtCore import QThread, Signal
+
+from Conversation import Message
+from TokenCounter import get_encoding, message_tokens
+
+CHUNK_TOKENS = 1000
+PROGRESS_STEP = 1 << 20
+SNIFF_SIZE = 8192
+PREVIEW_LENGTH = 80
+# Bytes per token read ahead when cutting up a long line; doubled as needed.
+WINDOW_BYTES = 8
+
+
+class Chunk:
+    # A byte range of the attached file; the text is only read back when the
+    # chunk is sent.
+    __slots__ = ("start", "end", "tokens", "preview")
+
+    def __init__(self, start, end, tokens, preview):
+        self.start = start
+        self.end = end
+        self.tokens = tokens
+        self.preview = preview
+
+
+class Attachment:
+    def __init__(self, path, size, chunks):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.size = size
+        self.chunks = chunks
+        self.messages = {}
+
+    def read(self, index):
+        chunk = self.chunks[index]
+        with open(self.path, "rb") as file:
+            file.seek(chunk.start)
+            data = file.read(chunk.end - chunk.start)
+        return data.decode("utf-8", errors="replace")
+
+    def message(self, index):
+        message = self.messages.get(index)
+        if message is None:
+            content = (
+                f"{self.name} (part {index + 1} of {len(self.chunks)}):\n"
+                f"{self.read(index)}"
+            )
+            message = Message("user", content, message_tokens("user", content))
+            self.messages[index] = message
+        return message
+
+
+def line_ranges(data):
+    start, size = 0, len(data)
+    while start < size:
+        end = data.find(b"\n", start) + 1 or size
+        yield start, end
+        start = end
+
+
+def preview(data, start, end):
+    text = data[start : min(end, start + PREVIEW_LENGTH * 4)]
+    for line in text.decode("utf-8", errors="replace").splitlines():
+        if line.strip():
+            return line.strip()[:PREVIEW_LENGTH]
+    return ""
+
+
+def count_range(encoding, data, start, end):
+    text = data[start:end].decode("utf-8", errors="replace")
+    return len(encoding.encode_ordinary(text))
+
+
+def char_start(data, position, start):
+    # Steps back over UTF-8 continuation bytes so a cut never splits a
+    # character; at most three, as in a valid sequence.
+    limit = max(start, position - 3)
+    while position > limit and 0x80 <= data[position] < 0xC0:
+        position -= 1
+    return position
+
+
+def split_line(encoding, data, start, end, max_tokens):
+    # A line longer than a whole chunk is cut where a character starts in the
+    # file's own bytes, and every piece is counted as it will be read back.
+    # Token boundaries alone will not do: a token can end inside a character,
+    # and on a line that is not valid UTF-8 the decoded text has other bytes.
+    while start < end:
+        window = max_tokens * WINDOW_BYTES
+        while True:
+            limit = min(end, start + window)
+            text = data[start:limit].decode("utf-8", errors="replace")
+            tokens = encoding.encode_ordinary(text)
+            if len(tokens) > max_tokens or limit == end:
+                break
+            window *= 2
+        if len(tokens) <= max_tokens:
+            yield start, end, len(tokens)
+            return
+        # The bytes of the first max_tokens tokens are a close first guess,
+        # exact for valid UTF-8 up to the character the last one ends in.
+        guess = start + len(encoding.decode_bytes(tokens[:max_tokens]))
+        cut = char_start(data, min(guess, limit - 1), start)
+        count = count_range(encoding, data, start, cut)
+        while count > max_tokens:
+            cut = char_start(
+                data, min(start + (cut - start) * max_tokens // count, cut - 1), start
+            )
+            count = count_range(encoding, data, start, cut)
+        if cut == start:
+            cut = start + 1
+            while cut < end and 0x80 <= data[cut] < 0xC0:
+                cut += 1
+            count = count_range(encoding, data, start, cut)
+        yield start, cut, count
+        start = cut
+
+
+def split_chunks(data, max_tokens=CHUNK_TOKENS, progress=None, interrupted=None):
+    # Lines are counted one at a time and packed into chunks of at most
+    # max_tokens. Counting a line on its own never gives fewer tokens than it
+    # takes in the whole text, so a chunk can come out slightly under its
+    # count but not over.
+    encoding = get_encoding()
+    chunks = []
+    start = end = used = 0
+    next_report = PROGRESS_STEP
+    for line_start, line_end in line_ranges(data):
+        text = data[line_start:line_end].decode("utf-8", errors="replace")
+        tokens = encoding.encode_ordinary(text)
+        if used and used + len(tokens) > max_tokens:
+            chunks.append(Chunk(start, end, used, preview(data, start, end)))
+            start, used = line_start, 0
+        if len(tokens) > max_tokens:
+            for piece in split_line(
+                encoding, data, line_start, line_end, max_tokens
+            ):
+                chunks.append(Chunk(*piece, preview(data, *piece[:2])))
+            start = line_end
+        else:
+            used += len(tokens)
+        end = line_end
+        if line_end >= next_report:
+            if interrupted is not None and interrupted():
+                return None
+            if progress is not None:
+                progress(line_end * 100 // len(data))
+            next_report = line_end + PROGRESS_STEP
+    if used:
+        chunks.append(Chunk(start, end, used, preview(data, start, end)))
+    return chunks
+
+
+def load_attachment(path, max_tokens=CHUNK_TOKENS, progress=None, interrupted=None):
+    name = os.path.basename(path)
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if not size:
+            raise ValueError(f"{name} is empty")
+        # Mapped rather than read in, so only the pages being split are held
+        # in memory, whatever the size of the file.
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if b"\0" in data[:SNIFF_SIZE]:
+                raise ValueError(f"{name} does not look like a text file")
+            chunks = split_chunks(data, max_tokens, progress, interrupted)
+    if chunks is None:
+        return None
+    return Attachment(path, size, chunks)
+
+
+class AttachmentWorker(QThread):
+    progress = Signal(int)
+    loaded = Signal(object)
+    failed = Signal(str)
+
+    def __init__(self, path, max_tokens=CHUNK_TOKENS, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.max_tokens = max_tokens
+
+    def run(self):
+        try:
+            attachment = load_attachment(
+                self.path,
+                self.max_tokens,
+                self.progress.emit,
+                self.isInterruptionRequested,
+            )
+        except (OSError, ValueError) as e:
+            self.failed.emit(str(e))
+            return
+        if attachment is not None:
+            self.loaded.emit(attachment)
@@ -0,0 +1,182 @@
+from PySide6.QtCore import QThreadPool
+from PySide6.QtGui import QTextCursor
+
+from CodeHighlighter import (
+    LAZY_SIZE,
+    PLACEHOLDER,
+    CodeHighlighter,
+    HighlightSignals,
+    HighlightTask,
+    block_key,
+    plain_html,
+    split_code_blocks,
+)
+
+
+class PendingTurn:
+    # A rendered turn still showing some code blocks as plain text. The two
+    # cursors sit on its first and last characters so the turn can be found
+    # again after other turns are added around it.
+    def __init__(self, turn, keys):
+        self.turn = turn
+        self.keys = keys
+        self.head = None
+        self.tail = None
+
+    def track(self, document, start, end):
+        self.head = QTextCursor(document)
+        self.head.setPosition(start)
+        self.tail = QTextCursor(document)
+        self.tail.setPosition(end - 1)
+
+
+class ChatRenderer:
+    def __init__(self, browser, cache_size=256):
+        self.browser = browser
+        self.cache_size = cache_size
+        self.html_cache = {}
+        self.highlighter = CodeHighlighter()
+        self.signals = HighlightSignals()
+        self.signals.highlighted.connect(self.block_ready)
+        # One thread is plenty: only blocks over LAZY_SIZE end up here.
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+        self.queued = set()
+        self.pending = {}
+
+    @staticmethod
+    def turn_markdown(prompt, response, token_usage):
+        markdown = f"####{prompt}\n"
+        markdown = markdown + ("___" + "\n<br>\n")
+        markdown = markdown + (f"{response}\n")
+        markdown = markdown + ("\n<br>\n")
+        markdown = markdown + (token_usage)
+        markdown = markdown + ("___" + "\n<br>\n<br>\n")
+        return markdown
+
+    def code_html(self, code, language, pending):
+        key = block_key(code, language)
+        html = self.highlighter.cached(key)
+        if html is not None:
+            return html
+        if len(code) <= LAZY_SIZE:
+            return self.highlighter.highlight(code, language, key)
+        # Too big to highlight without stalling the view; show it plain for
+        # now and swap the highlighted version in once the worker is done.
+        pending.add(key)
+        if key not in self.queued:
+            self.queued.add(key)
+            self.pool.start(
+                HighlightTask(self.highlighter, self.signals, key, code, language)
+            )
+        return plain_html(code)
+
+    def to_html(self, markdown, pending=None):
+        html = self.html_cache.get(markdown)
+        if html is None:
+            import markdown2
+
+            text, blocks = split_code_blocks(markdown)
+            html = markdown2.markdown(text)
+            waiting = set()
+            for index, (language, code) in enumerate(blocks):
+                html = html.replace(
+                    f"<p>{PLACEHOLDER.format(index)}</p>",
+                    self.code_html(code, language, waiting),
+                    1,
+                )
+            if pending is not None:
+                pending.update(waiting)
+            if waiting:
+                return html
+            if len(self.html_cache) >= self.cache_size:
+                self.html_cache.pop(next(iter(self.html_cache)))
+            self.html_cache[markdown] = html
+        return html
+
+    def turn_to_html(self, prompt, response, token_usage, turn_id=None, pending=None):
+        html = self.to_html(self.turn_markdown(prompt, response, token_usage), pending)
+        if turn_id is None:
+            return html
+        # Named so a search result can scroll straight to the turn.
+        return f'<a name="turn-{turn_id}"></a>{html}'
+
+    def render_turn(self, turn):
+        keys = set()
+        html = self.turn_to_html(*turn, pending=keys)
+        if not keys:
+            return html, None
+        tracker = PendingTurn(turn, keys)
+        for key in keys:
+            self.pending.setdefault(key, []).append(tracker)
+        return html, tracker
+
+    def append_turn(self, prompt, response, token_usage, turn_id=None):
+        html, tracker = self.render_turn((prompt, response, token_usage, turn_id))
+        self.append_html(html, tracker)
+        return html
+
+    def prepend_turns(self, turns):
+        rendered = [self.render_turn(tuple(turn)) for turn in turns]
+        if not rendered:
+            return
+        scroll_bar = self.browser.verticalScrollBar()
+        from_bottom = scroll_bar.maximum() - scroll_bar.value()
+        cursor = QTextCursor(self.browser.document())
+        cursor.movePosition(QTextCursor.Start)
+        empty = self.browser.document().isEmpty()
+        # Turns waiting on a highlight go in one at a time so their positions
+        # are known; the rest are joined into as few inserts as possible.
+        batch = []
+        for index, (html, tracker) in enumerate(rendered):
+            if tracker is None:
+                batch.append(html)
+                continue
+            if batch:
+                cursor.insertHtml("".join(batch))
+                cursor.insertBlock()
+                batch = []
+            start = cursor.position()
+            cursor.insertHtml(html)
+            tracker.track(self.browser.document(), start, cursor.position())
+            if index < len(rendered) - 1:
+                cursor.insertBlock()
+        if batch:
+            cursor.insertHtml("".join(batch))
+        if not empty:
+            cursor.insertBlock()
+        scroll_bar.setValue(scroll_bar.maximum() - from_bottom)
+
+    def append_html(self, html, tracker=None):
+        cursor = QTextCursor(self.browser.document())
+        cursor.movePosition(QTextCursor.End)
+        if not self.browser.document().isEmpty():
+            cursor.insertBlock()
+        start = cursor.position()
+        cursor.insertHtml(html)
+        if tracker is not None:
+            tracker.track(self.browser.document(), start, cursor.position())
+        self.browser.moveCursor(QTextCursor.End)
+
+    def block_ready(self, key):
+        self.queued.discard(key)
+        for tracker in self.pending.pop(key, []):
+            tracker.keys.discard(key)
+            if not tracker.keys and tracker.head is not None:
+                self.refresh_turn(tracker)
+
+    def refresh_turn(self, tracker):
+        html = self.turn_to_html(*tracker.turn)
+        scroll_bar = self.browser.verticalScrollBar()
+        at_bottom = scroll_bar.value() == scroll_bar.maximum()
+        position = scroll_bar.value()
+        cursor = QTextCursor(self.browser.document())
+        start = tracker.head.position()
+        cursor.setPosition(start)
+        cursor.setPosition(tracker.tail.position() + 1, QTextCursor.KeepAnchor)
+        cursor.insertHtml(html)
+        scroll_bar.setValue(scroll_bar.maximum() if at_bottom else position)
+
+    def clear(self):
+        self.pending = {}
+        self.browser.clear()
@@ -0,0 +1,170 @@
+import threading
+import time
+
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+from InterfaceUtility import TEMPERATURE
+from RateLimiter import RequestCancelled
+from TokenCounter import count_message_tokens, get_encoding
+
+
+def build_response(chunk, messages, content, finish_reason):
+    from openai.openai_object import OpenAIObject
+
+    prompt_tokens = count_message_tokens(messages)
+    completion_tokens = len(get_encoding().encode_ordinary(content))
+    return OpenAIObject.construct_from(
+        {
+            "id": chunk.get("id") if chunk else None,
+            "object": "chat.completion",
+            "created": chunk.get("created") if chunk else int(time.time()),
+            "model": chunk.get("model") if chunk else None,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": finish_reason,
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+    )
+
+
+def run_completion(
+    signals,
+    chat_model,
+    api_key,
+    messages,
+    model,
+    stream,
+    temperature,
+    cancelled,
+    scheduler=None,
+):
+    import openai
+    from ApiClient import RequestTiming
+
+    timing = RequestTiming()
+    started = time.perf_counter()
+    prompt_tokens = count_message_tokens(messages)
+
+    def request(key=None):
+        return chat_model.create_completion(
+            key or api_key,
+            messages,
+            model,
+            stream=stream,
+            temperature=temperature,
+            timing=timing,
+        )
+
+    try:
+        if scheduler is None:
+            response = request()
+        else:
+            response = scheduler.run(
+                request, prompt_tokens, cancelled, signals.retrying.emit
+            )
+        if not stream:
+            signals.first_token.emit(time.perf_counter() - started)
+            signals.delta.emit(response.choices[0].message.content)
+            signals.timed.emit(timing)
+            if scheduler is not None:
+                scheduler.record_usage(prompt_tokens, response.usage.total_tokens)
+            signals.completed.emit(response)
+            return
+
+        parts = []
+        chunk = None
+        finish_reason = None
+        for chunk in response:
+            if cancelled():
+                response.close()
+                finish_reason = "cancelled"
+                break
+            choice = chunk.choices[0]
+            text = choice.delta.get("content")
+            if text:
+                if not parts:
+                    signals.first_token.emit(time.perf_counter() - started)
+                parts.append(text)
+                signals.delta.emit(text)
+            finish_reason = choice.get("finish_reason") or finish_reason
+    except RequestCancelled:
+        signals.completed.emit(build_response(None, messages, "", "cancelled"))
+        return
+    except openai.error.AuthenticationError:
+        signals.failed.emit("Invalid API key. Please set one in the menu.")
+        return
+    except Exception as e:
+        signals.failed.emit(f"Request failed: {e}")
+        return
+    if cancelled():
+        finish_reason = "cancelled"
+    signals.timed.emit(timing)
+    response = build_response(chunk, messages, "".join(parts), finish_reason)
+    if scheduler is not None:
+        scheduler.record_usage(prompt_tokens, response.usage.total_tokens)
+    signals.completed.emit(response)
+
+
+class CompletionSignals(QObject):
+    delta = Signal(str)
+    first_token = Signal(float)
+    retrying = Signal(int, float, str)
+    timed = Signal(object)
+    completed = Signal(object)
+    failed = Signal(str)
+
+
+class CompletionTask(QRunnable):
+    def __init__(
+        self,
+        chat_model,
+        api_key,
+        messages,
+        model="gpt-3.5-turbo",
+        stream=True,
+        temperature=TEMPERATURE,
+        scheduler=None,
+    ):
+        super().__init__()
+        self.chat_model = chat_model
+        self.api_key = api_key
+        self.messages = messages
+        self.model = model
+        self.stream = stream
+        self.temperature = temperature
+        self.scheduler = scheduler
+        self.signals = CompletionSignals()
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        run_completion(
+            self.signals,
+            self.chat_model,
+            self.api_key,
+            self.messages,
+            self.model,
+            self.stream,
+            self.temperature,
+            self.cancel_event.is_set,
+            self.scheduler,
+        )
+
+
+class WarmConnectionTask(QRunnable):
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    def run(self):
+        self.client.warm()
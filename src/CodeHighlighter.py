@@ -0,0 +1,96 @@
+import hashlib
+import html
+import re
+import threading
+from collections import OrderedDict
+
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+FENCE = re.compile(r"^```[ \t]*([\w+#.-]*)[^\n]*\n(.*?)^```[ \t]*$", re.M | re.S)
+PLACEHOLDER = "CODEBLOCKPLACEHOLDER{}"
+LAZY_SIZE = 20000
+
+
+def block_key(code, language):
+    return hashlib.sha1(f"{language}\0{code}".encode()).hexdigest()
+
+
+def plain_html(code):
+    return f"<pre>{html.escape(code)}</pre>"
+
+
+def split_code_blocks(markdown):
+    # Fenced blocks are swapped for placeholders so markdown2 leaves them
+    # alone; the caller puts the highlighted HTML back in their place.
+    blocks = []
+
+    def stash(match):
+        blocks.append((match.group(1).lower(), match.group(2)))
+        return f"\n\n{PLACEHOLDER.format(len(blocks) - 1)}\n\n"
+
+    return FENCE.sub(stash, markdown), blocks
+
+
+class CodeHighlighter:
+    def __init__(self, cache_size=512):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def cached(self, key):
+        with self.lock:
+            html = self.cache.get(key)
+            if html is not None:
+                self.cache.move_to_end(key)
+            return html
+
+    def highlight(self, code, language, key=None):
+        key = key or block_key(code, language)
+        html = self.cached(key)
+        if html is not None:
+            return html
+        html = self.render(code, language)
+        with self.lock:
+            self.cache[key] = html
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return html
+
+    @staticmethod
+    def render(code, language):
+        try:
+            from pygments import highlight
+            from pygments.formatters import HtmlFormatter
+            from pygments.lexers import get_lexer_by_name
+            from pygments.util import ClassNotFound
+        except ImportError:
+            return plain_html(code)
+        # Guessing the language means trying every lexer, which is too slow
+        # for the GUI thread, so unlabelled blocks stay plain.
+        if not language:
+            return plain_html(code)
+        try:
+            lexer = get_lexer_by_name(language)
+        except ClassNotFound:
+            return plain_html(code)
+        # Inline styles, since QTextBrowser ignores style sheets with classes.
+        formatter = HtmlFormatter(noclasses=True, nowrap=True)
+        return f"<pre>{highlight(code, lexer, formatter)}</pre>"
+
+
+class HighlightSignals(QObject):
+    highlighted = Signal(str)
+
+
+class HighlightTask(QRunnable):
+    def __init__(self, highlighter, signals, key, code, language):
+        super().__init__()
+        self.highlighter = highlighter
+        self.signals = signals
+        self.key = key
+        self.code = code
+        self.language = language
+
+    def run(self):
+        self.highlighter.highlight(self.code, self.language, self.key)
+        self.signals.highlighted.emit(self.key)
@@ -0,0 +1,116 @@
+import json
+
+
+def encode_message(message):
+    # Same form as the response cache key, so one encoding serves both.
+    return json.dumps(message, sort_keys=True, separators=(",", ":"))
+
+
+class Message(dict):
+    # A chat message that keeps its JSON and token count once worked out.
+    # Turns build theirs once and never change them, so each request only
+    # encodes the messages it has not sent before.
+    __slots__ = ("encoded", "tokens")
+
+    def __init__(self, role, content, tokens=None):
+        super().__init__(role=role, content=content)
+        self.encoded = None
+        self.tokens = tokens
+
+    def json(self):
+        if self.encoded is None:
+            self.encoded = encode_message(self)
+        return self.encoded
+
+
+def encode_messages(messages):
+    return "[{}]".format(
+        ",".join(
+            message.json() if isinstance(message, Message) else encode_message(message)
+            for message in messages
+        )
+    )
+
+
+class Turn:
+    __slots__ = (
+        "id",
+        "prompt",
+        "response",
+        "prompt_tokens",
+        "response_tokens",
+        "payload",
+    )
+
+    def __init__(
+        self, turn_id, prompt, response=None, prompt_tokens=0, response_tokens=0
+    ):
+        self.id = turn_id
+        self.prompt = prompt
+        self.response = response
+        self.prompt_tokens = prompt_tokens
+        self.response_tokens = response_tokens
+        self.payload = None
+
+    def tokens(self):
+        return self.prompt_tokens + self.response_tokens
+
+    def answer(self, response, response_tokens):
+        self.response = response
+        self.response_tokens = response_tokens
+
+    def messages(self):
+        # Built the first time the turn is sent and reused after that.
+        if self.payload is None:
+            self.payload = (Message("user", self.prompt, self.prompt_tokens),)
+        if self.response is not None and len(self.payload) == 1:
+            self.payload += (
+                Message("assistant", self.response, self.response_tokens),
+            )
+        return self.payload
+
+
+class Conversation:
+    # Turns oldest first. While a request is in flight the last turn holds the
+    # prompt being sent and has no response yet.
+    def __init__(self):
+        self.records = []
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    @property
+    def last(self):
+        return self.records[-1]
+
+    @property
+    def saved(self):
+        if self.records and self.records[-1].response is None:
+            return len(self.records) - 1
+        return len(self.records)
+
+    def ask(self, prompt, prompt_tokens):
+        self.records.append(Turn(None, prompt, prompt_tokens=prompt_tokens))
+
+    def retract(self):
+        return self.records.pop().prompt
+
+    def prepend(self, turns):
+        self.records[:0] = turns
+
+    def first_after(self, turn_id):
+        # Saved turns are in id order; bisect only takes key= from Python 3.10.
+        lo, hi = 0, self.saved
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.records[mid].id <= turn_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def clear(self):
+        self.records = []
@@ -0,0 +1,55 @@
+from ChatWorker import CompletionTask
+from InterfaceUtility import MODELS
+
+KEEP_TURNS = 4
+SUMMARY_BATCH = 4
+SUMMARY_MODEL = MODELS[0]
+SUMMARY_TEMPERATURE = 0.2
+SUMMARY_INSTRUCTIONS = (
+    "You keep a running summary of a conversation between a user and an "
+    "assistant. Merge the new exchanges into the existing summary. Keep facts, "
+    "decisions, names, code identifiers and open questions; drop pleasantries. "
+    "Reply with the updated summary only, in at most 250 words."
+)
+
+
+def summary_messages(summary, prompts, responses):
+    exchanges = "\n\n".join(
+        f"User: {prompt}\nAssistant: {response}"
+        for prompt, response in zip(prompts, responses)
+    )
+    return [
+        {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+        {
+            "role": "user",
+            "content": f"Existing summary:\n{summary or '(none)'}\n\n"
+            f"New exchanges:\n{exchanges}",
+        },
+    ]
+
+
+class SummaryTask(CompletionTask):
+    # Streamed like a chat request, so a cancelled summary stops at the next
+    # chunk instead of holding up closing the tab or window.
+    def __init__(
+        self,
+        chat_model,
+        api_key,
+        session_id,
+        upto_turn_id,
+        summary,
+        prompts,
+        responses,
+        scheduler=None,
+    ):
+        super().__init__(
+            chat_model,
+            api_key,
+            summary_messages(summary, prompts, responses),
+            SUMMARY_MODEL,
+            True,
+            SUMMARY_TEMPERATURE,
+            scheduler,
+        )
+        self.session_id = session_id
+        self.upto_turn_id = upto_turn_id
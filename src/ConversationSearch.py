@@ -0,0 +1,132 @@
+import time
+
+from PySide6.QtCore import (QObject, QRunnable, Qt, QThread, QThreadPool,
+                            QTimer, Signal)
+from PySide6.QtWidgets import (QDialog, QLabel, QLineEdit, QListWidget,
+                               QListWidgetItem, QVBoxLayout)
+
+from ConversationStore import ConversationStore
+
+
+class SearchIndexer(QThread):
+    progress = Signal(int)
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+
+    def run(self):
+        # SQLite connections belong to one thread, so the backfill uses its own.
+        store = ConversationStore(self.path)
+        indexed = 0
+        try:
+            while not self.isInterruptionRequested():
+                count = store.backfill_search()
+                if not count:
+                    break
+                indexed += count
+                self.progress.emit(indexed)
+        finally:
+            store.close()
+
+
+class SearchSignals(QObject):
+    finished = Signal(int, object, float)
+
+
+class SearchTask(QRunnable):
+    def __init__(self, path, text, generation, signals):
+        super().__init__()
+        self.path = path
+        self.text = text
+        self.generation = generation
+        self.signals = signals
+
+    def run(self):
+        # Each search opens its own connection, as the pool's thread can change.
+        store = ConversationStore(self.path)
+        try:
+            started = time.perf_counter()
+            rows = store.search(self.text)
+            elapsed = (time.perf_counter() - started) * 1000
+        finally:
+            store.close()
+        self.signals.finished.emit(self.generation, rows, elapsed)
+
+
+class SearchDialog(QDialog):
+    turn_selected = Signal(int, int)
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Search Conversations")
+        self.resize(600, 400)
+        self.store = store
+        self.query = QLineEdit()
+        self.query.setPlaceholderText("Search prompts and responses")
+        self.results = QListWidget()
+        self.results.setWordWrap(True)
+        self.status_label = QLabel()
+        # Queries run off the GUI thread; results for anything but the latest
+        # query are dropped.
+        self.generation = 0
+        self.shown = 0
+        self.open_when_shown = False
+        self.signals = SearchSignals()
+        self.signals.finished.connect(self.show_results)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(150)
+        self.timer.timeout.connect(self.search)  # type: ignore
+        self.query.textChanged.connect(self.timer.start)  # type: ignore
+        self.query.returnPressed.connect(self.open_current)  # type: ignore
+        self.results.itemActivated.connect(self.open_item)  # type: ignore
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.query)
+        layout.addWidget(self.results)
+        layout.addWidget(self.status_label)
+        self.setLayout(layout)
+
+    def search(self):
+        self.generation += 1
+        self.pool.start(
+            SearchTask(self.store.path, self.query.text(), self.generation, self.signals)
+        )
+
+    def show_results(self, generation, rows, elapsed):
+        if generation != self.generation:
+            return
+        self.shown = generation
+        self.results.clear()
+        for row in rows:
+            snippet = " ".join(row["snippet"].split())
+            item = QListWidgetItem(f"{row['title']}\n{snippet}")
+            item.setData(Qt.UserRole, (row["session_id"], row["id"]))
+            self.results.addItem(item)
+        if rows:
+            self.results.setCurrentRow(0)
+        self.status_label.setText(f"{len(rows)} results in {elapsed:.1f} ms")
+        if self.open_when_shown:
+            self.open_when_shown = False
+            self.open_current()
+
+    def show_progress(self, indexed):
+        self.status_label.setText(f"Indexing older turns: {indexed} done")
+
+    def open_current(self):
+        if self.timer.isActive():
+            self.timer.stop()
+            self.search()
+        if self.shown != self.generation:
+            self.open_when_shown = True
+            return
+        if self.results.currentItem() is not None:
+            self.open_item(self.results.currentItem())
+
+    def open_item(self, item):
+        session_id, turn_id = item.data(Qt.UserRole)
+        self.turn_selected.emit(session_id, turn_id)
+        self.accept()
@@ -0,0 +1,254 @@
+import re
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    prompt TEXT NOT NULL,
+    response TEXT NOT NULL,
+    token_usage TEXT NOT NULL,
+    raw TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    response_tokens INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_by_session ON turns (session_id, id);
+CREATE TABLE IF NOT EXISTS summaries (
+    session_id INTEGER PRIMARY KEY REFERENCES sessions(id),
+    upto_turn_id INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS turn_vectors (
+    turn_id INTEGER PRIMARY KEY REFERENCES turns(id),
+    vector BLOB NOT NULL
+);
+"""
+
+# New turns are indexed by the trigger in the same transaction that saves
+# them; turns saved before the index existed are left for backfill_search.
+SEARCH_SCHEMA = """
+BEGIN;
+CREATE VIRTUAL TABLE turns_fts USING fts5(
+    prompt, response, content='turns', content_rowid='id', prefix='3'
+);
+CREATE TRIGGER turns_fts_insert AFTER INSERT ON turns BEGIN
+    INSERT INTO turns_fts (rowid, prompt, response)
+    VALUES (new.id, new.prompt, new.response);
+END;
+CREATE TABLE search_backfill (pending_upto INTEGER NOT NULL);
+INSERT INTO search_backfill SELECT COALESCE(MAX(id), 0) FROM turns;
+COMMIT;
+"""
+
+
+def match_query(text):
+    # Every word must match. The last one is usually still being typed, so
+    # from three characters on it also matches longer words.
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    query = " ".join(f'"{word}"' for word in words)
+    return query + "*" if len(words[-1]) >= 3 else query
+
+
+class ConversationStore:
+    def __init__(self, path="conversations.db"):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.searchable = self.create_search_index()
+
+    def create_search_index(self):
+        exists = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'turns_fts'"
+        ).fetchone()
+        if exists:
+            return True
+        try:
+            self.connection.executescript(SEARCH_SCHEMA)
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5.
+            self.connection.rollback()
+            return False
+        return True
+
+    def create_session(self, title):
+        now = time.time()
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO sessions (title, created, updated) VALUES (?, ?, ?)",
+                (title, now, now),
+            )
+        return cursor.lastrowid
+
+    def latest_session(self):
+        row = self.connection.execute(
+            "SELECT id FROM sessions ORDER BY updated DESC LIMIT 1"
+        ).fetchone()
+        return row["id"] if row else None
+
+    def list_sessions(self):
+        return self.connection.execute(
+            "SELECT id, title, updated FROM sessions ORDER BY updated DESC"
+        ).fetchall()
+
+    def append_turn(
+        self,
+        session_id,
+        prompt,
+        response,
+        token_usage,
+        raw,
+        prompt_tokens,
+        response_tokens,
+    ):
+        now = time.time()
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO turns (session_id, prompt, response, token_usage, raw,"
+                " prompt_tokens, response_tokens, created)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    session_id,
+                    prompt,
+                    response,
+                    token_usage,
+                    raw,
+                    prompt_tokens,
+                    response_tokens,
+                    now,
+                ),
+            )
+            self.connection.execute(
+                "UPDATE sessions SET updated = ? WHERE id = ?", (now, session_id)
+            )
+        return cursor.lastrowid
+
+    def load_turns(self, session_id, before_id=None, limit=20):
+        # Newest page first, returned oldest to newest so it can be rendered
+        # in order.
+        if before_id is None:
+            rows = self.connection.execute(
+                "SELECT * FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (session_id, limit),
+            ).fetchall()
+        else:
+            rows = self.connection.execute(
+                "SELECT * FROM turns WHERE session_id = ? AND id < ?"
+                " ORDER BY id DESC LIMIT ?",
+                (session_id, before_id, limit),
+            ).fetchall()
+        rows.reverse()
+        return rows
+
+    def turns_between(self, session_id, after_id, before_id, limit):
+        # Oldest first, whether or not the turns have been paged in.
+        return self.connection.execute(
+            "SELECT * FROM turns WHERE session_id = ? AND id > ? AND id < ?"
+            " ORDER BY id LIMIT ?",
+            (session_id, after_id, before_id, limit),
+        ).fetchall()
+
+    def iter_turns(self, session_id):
+        return self.connection.execute(
+            "SELECT * FROM turns WHERE session_id = ? ORDER BY id", (session_id,)
+        )
+
+    def get_turns(self, turn_ids):
+        placeholders = ", ".join("?" * len(turn_ids))
+        return self.connection.execute(
+            f"SELECT * FROM turns WHERE id IN ({placeholders}) ORDER BY id",
+            list(turn_ids),
+        ).fetchall()
+
+    def load_vectors(self):
+        return self.connection.execute(
+            "SELECT turns.id, turns.prompt_tokens + turns.response_tokens, vector"
+            " FROM turn_vectors JOIN turns ON turns.id = turn_vectors.turn_id"
+            " ORDER BY turns.id"
+        )
+
+    def unembedded_turns(self, limit=1000):
+        return self.connection.execute(
+            "SELECT turns.id, prompt, response,"
+            " prompt_tokens + response_tokens AS tokens"
+            " FROM turns LEFT JOIN turn_vectors ON turn_vectors.turn_id = turns.id"
+            " WHERE turn_vectors.turn_id IS NULL ORDER BY turns.id LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+    def save_vectors(self, rows):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO turn_vectors (turn_id, vector) VALUES (?, ?)",
+                rows,
+            )
+
+    def save_summary(self, session_id, upto_turn_id, summary):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO summaries"
+                " (session_id, upto_turn_id, summary, updated) VALUES (?, ?, ?, ?)",
+                (session_id, upto_turn_id, summary, time.time()),
+            )
+
+    def load_summary(self, session_id):
+        return self.connection.execute(
+            "SELECT upto_turn_id, summary FROM summaries WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+
+    def backfill_search(self, limit=1000):
+        # Indexes one batch of older turns, newest first, and returns how many
+        # were indexed; 0 once everything is searchable.
+        if not self.searchable:
+            return 0
+        with self.connection:
+            row = self.connection.execute(
+                "SELECT pending_upto FROM search_backfill"
+            ).fetchone()
+            if not row or not row[0]:
+                return 0
+            rows = self.connection.execute(
+                "SELECT id, prompt, response FROM turns WHERE id <= ?"
+                " ORDER BY id DESC LIMIT ?",
+                (row[0], limit),
+            ).fetchall()
+            self.connection.executemany(
+                "INSERT INTO turns_fts (rowid, prompt, response) VALUES (?, ?, ?)",
+                rows,
+            )
+            self.connection.execute(
+                "UPDATE search_backfill SET pending_upto = ?",
+                (rows[-1]["id"] - 1 if rows else 0,),
+            )
+        return len(rows)
+
+    def search(self, text, limit=50):
+        query = match_query(text)
+        if query is None or not self.searchable:
+            return []
+        return self.connection.execute(
+            "SELECT turns.id, turns.session_id, sessions.title,"
+            " snippet(turns_fts, -1, '[', ']', '...', 12) AS snippet"
+            " FROM turns_fts"
+            " JOIN turns ON turns.id = turns_fts.rowid"
+            " JOIN sessions ON sessions.id = turns.session_id"
+            " WHERE turns_fts MATCH ? ORDER BY turns_fts.rowid DESC LIMIT ?",
+            (query, limit),
+        ).fetchall()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,866 @@
+import json
+import time
+
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtGui import QTextCursor, QTextOption
+from PySide6.QtWidgets import (QCheckBox, QComboBox, QFileDialog, QHBoxLayout,
+                               QLabel, QListWidget, QListWidgetItem,
+                               QPushButton, QSpinBox, QSplitter, QTextBrowser,
+                               QVBoxLayout, QWidget)
+
+from Attachments import AttachmentWorker
+from ChatRenderer import ChatRenderer
+from ChatWorker import CompletionTask
+from Conversation import Conversation, Turn
+from ConversationMemory import KEEP_TURNS, SUMMARY_BATCH, SummaryTask
+from InterfaceUtility import MODELS, TEMPERATURE, ChatInput, ChatModel
+from RawHistory import RawHistoryModel
+from ResponseCache import cache_key
+from Retrieval import TOKEN_BUDGET
+from TokenCounter import DebouncedTokenCounter, count_tokens, message_tokens
+
+TURN_PAGE_SIZE = 20
+
+
+class ConversationTab(QWidget):
+    def __init__(self, main_window, model=None):
+        super().__init__()
+        # The store, scheduler, metrics, response cache, retrieval index and
+        # worker pool are shared with the other tabs through main_window.
+        self.main_window = main_window
+        self.turns = Conversation()
+        self.summary = None
+        self.summary_upto = 0
+        self.summary_task = None
+        self.context_report = ""
+        self.task = None
+        self.stream_start = None
+        self.stream_parts = []
+        self.request_started = None
+        self.first_token_time = None
+        self.request_timing = None
+        self.pending_cache_key = None
+        self.submit_started = None
+        self.prepared = None
+        self.session_id = None
+        self.oldest_turn_id = None
+        self.loaded = True
+        self.unrendered = []
+        self.history = RawHistoryModel(parent=self)
+        self.attachment_worker = None
+        # The context for the next prompt is rebuilt whenever the history or
+        # the context settings change, once the event loop is idle.
+        self.prepare_timer = QTimer(self)
+        self.prepare_timer.setSingleShot(True)
+        self.prepare_timer.setInterval(0)
+        self.prepare_timer.timeout.connect(self.prepare_context)
+        self.init_ui(model)
+
+    def init_ui(self, model):
+        main_window = self.main_window
+        layout = QVBoxLayout()
+
+        self.model_dropdown = QComboBox()
+        self.model_dropdown.addItems(MODELS)
+        if model is not None:
+            self.model_dropdown.setCurrentText(model)
+        self.current_model = self.model_dropdown.currentText()
+        self.model_dropdown.currentTextChanged.connect(self.change_model)  # type: ignore
+        layout.addWidget(self.model_dropdown)
+
+        self.context_label = QLabel("Number of messages to keep in context: ")
+        self.context_label.setToolTip(
+            "The number of messages to keep in context for the AI. \nThe more messages, the more context the AI has to work with, but the longer it takes to generate a response. \nThe default is 2 and is recommended for most use cases. Choice is reflected after pressing submit and is not retroactive."
+        )
+        self.context_label.setFont(main_window.pil_font)
+        self.context_label.setAlignment(Qt.AlignRight)
+        layout.addWidget(self.context_label)
+
+        self.context_choice = QComboBox()
+        for i in range(0, 11):
+            self.context_choice.addItem(str(i))
+        self.context_choice.setCurrentIndex(2)
+        self.context_choice.setToolTip(self.context_label.toolTip())
+        self.context_choice.currentIndexChanged.connect(self.invalidate_context)  # type: ignore
+        layout.addWidget(self.context_choice)
+
+        self.token_budget_label = QLabel("Context token budget: ")
+        self.token_budget_label.setToolTip(
+            "When set, the context is filled with the newest messages that fit in this many tokens instead of a fixed number of messages."
+        )
+        self.token_budget_label.setFont(main_window.pil_font)
+        self.token_budget_label.setAlignment(Qt.AlignRight)
+        layout.addWidget(self.token_budget_label)
+
+        self.token_budget_choice = QSpinBox()
+        self.token_budget_choice.setRange(0, 128000)
+        self.token_budget_choice.setSingleStep(256)
+        self.token_budget_choice.setSpecialValueText("Off")
+        self.token_budget_choice.setToolTip(self.token_budget_label.toolTip())
+        self.token_budget_choice.valueChanged.connect(self.invalidate_context)  # type: ignore
+        layout.addWidget(self.token_budget_choice)
+
+        self.splitter = QSplitter(Qt.Vertical)  # type: ignore
+
+        self.chat = QTextBrowser()
+        self.chat.setFont(main_window.response_font)
+        self.chat.setFontPointSize(11)
+        self.chat.setPlaceholderText("Your assistant's response will appear here")
+        self.chat.setAcceptRichText(True)
+        self.chat.setWordWrapMode(QTextOption.WrapAtWordBoundaryOrAnywhere)
+        self.chat.setReadOnly(True)
+        self.chat_renderer = ChatRenderer(self.chat)
+        self.chat.verticalScrollBar().valueChanged.connect(self.load_older_turns)
+        self.splitter.addWidget(self.chat)
+
+        self.size_button_widget = QWidget()
+        self.size_button_layout = QHBoxLayout()
+        self.size_button_layout.setAlignment(Qt.AlignRight)
+        self.minus_button = QPushButton("-")
+        self.minus_button.setFixedWidth(30)
+        self.plus_button = QPushButton("+")
+        self.plus_button.setFixedWidth(30)
+        self.plus_button.clicked.connect(self.increase_font_size)
+        self.minus_button.clicked.connect(self.decrease_font_size)
+        self.size_button_layout.addWidget(self.minus_button)
+        self.size_button_layout.addWidget(self.plus_button)
+        self.size_button_widget.setLayout(self.size_button_layout)
+        self.splitter.addWidget(self.size_button_widget)
+
+        self.input_text_edit = ChatInput(self.submit_text)
+        self.input_text_edit.setFont(main_window.input_text_font)
+        self.input_text_edit.setPlaceholderText("Enter your text here")
+        self.input_text_edit.textChanged.connect(self.parse_text)  # type: ignore
+        self.input_text_edit.setAcceptRichText(False)
+        self.splitter.addWidget(self.input_text_edit)
+
+        # Attached files are listed by chunk; only the ticked chunks are sent.
+        self.attachment_panel = QWidget()
+        attachment_layout = QVBoxLayout()
+        attachment_layout.setContentsMargins(0, 0, 0, 0)
+        attachment_header = QHBoxLayout()
+        self.attachment_label = QLabel()
+        self.attachment_label.setFont(main_window.pil_font)
+        attachment_header.addWidget(self.attachment_label)
+        self.detach_button = QPushButton("Detach All")
+        self.detach_button.clicked.connect(self.detach_files)  # type: ignore
+        attachment_header.addWidget(self.detach_button)
+        attachment_layout.addLayout(attachment_header)
+        self.attachment_list = QListWidget()
+        self.attachment_list.itemChanged.connect(self.update_attachment_label)  # type: ignore
+        attachment_layout.addWidget(self.attachment_list)
+        self.attachment_panel.setLayout(attachment_layout)
+        self.attachment_panel.hide()
+        self.splitter.addWidget(self.attachment_panel)
+
+        self.parsed_info_label = QLabel(
+            f"Token Counts are estimated with Tiktoken and don't include special tokens or tokens added by the model and its response"
+        )
+        self.parsed_info_label.setWordWrap(True)
+        self.parsed_info_label.setFont(main_window.pil_font)
+        self.splitter.addWidget(self.parsed_info_label)
+
+        self.token_counter = DebouncedTokenCounter(
+            self.input_text_edit.toPlainText, parent=self
+        )
+        self.token_counter.counted.connect(self.parsed_info_label.setText)
+
+        layout.addWidget(self.splitter)
+        self.splitter.setSizes([600, 10, 210, 120, 80])
+
+        self.bottom_layout = QHBoxLayout()
+        self.submit_button = QPushButton("Submit")
+        self.bottom_layout.addWidget(self.submit_button)
+
+        self.submit_button.clicked.connect(self.submit_text)  # type: ignore
+        self.submit_button.setAutoDefault(True)
+        self.submit_button.setShortcut("Ctrl+Enter")
+        self.submit_button.keyPressEvent = self.submit_text  # type: ignore
+
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.cancel_request)  # type: ignore
+        self.bottom_layout.addWidget(self.stop_button)
+
+        self.attach_button = QPushButton("Attach...")
+        self.attach_button.setToolTip(
+            "Attach a text file. It is split into chunks in the background; tick the chunks to send with each request."
+        )
+        self.attach_button.clicked.connect(self.attach_file)  # type: ignore
+        self.bottom_layout.addWidget(self.attach_button)
+
+        self.stream_checkbox = QCheckBox("Stream")
+        self.stream_checkbox.setChecked(True)
+        self.stream_checkbox.setToolTip(
+            "Show the response as it is generated instead of waiting for the full completion."
+        )
+        self.bottom_layout.addWidget(self.stream_checkbox)
+
+        self.memory_checkbox = QCheckBox("Memory")
+        self.memory_checkbox.setToolTip(
+            f"Keep the newest {KEEP_TURNS} turns verbatim and send older ones as a running summary that is updated in the background."
+        )
+        self.memory_checkbox.toggled.connect(self.summarize_older_turns)  # type: ignore
+        self.memory_checkbox.toggled.connect(self.invalidate_context)  # type: ignore
+        self.bottom_layout.addWidget(self.memory_checkbox)
+
+        self.recall_checkbox = QCheckBox("Recall")
+        self.recall_checkbox.setToolTip(
+            f"Also send the saved turns, from any conversation, most relevant to the prompt (up to {TOKEN_BUDGET} tokens)."
+        )
+        self.bottom_layout.addWidget(self.recall_checkbox)
+
+        self.request_status_label = QLabel()
+        self.request_status_label.setFont(main_window.pil_font)
+        self.bottom_layout.addWidget(self.request_status_label)
+
+        layout.addLayout(self.bottom_layout)
+        self.setLayout(layout)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.render_pending()
+
+    def render_pending(self):
+        # Tabs in the background keep their turns as data only; the chat view
+        # is filled in the first time the tab is shown after they arrive.
+        if not self.loaded:
+            self.load_session()
+        for turn in self.unrendered:
+            self.chat_renderer.append_turn(*turn)
+        self.unrendered = []
+        if self.task is not None and self.stream_start is None:
+            self.begin_stream_block(self.turns.last.prompt)
+            self.insert_preview("".join(self.stream_parts))
+
+    def is_empty(self):
+        return (
+            self.session_id is None and not len(self.turns) and self.task is None
+        )
+
+    def increase_font_size(self):
+        # Get the current font size and increase it by 1
+        current_size = self.chat.fontPointSize()
+        self.chat.setVisible(False)
+        self.chat.selectAll()
+        new_size = current_size + 1
+        # Set the new font size for the QTextEdit widget
+        font = self.chat.currentFont()
+        font.setPointSize(int(new_size))
+        self.chat.setCurrentFont(font)
+        self.chat.moveCursor(QTextCursor.End)
+        self.chat.setVisible(True)
+
+    def decrease_font_size(self):
+        # Get the current font size and decrease it by 1
+        current_size = self.chat.fontPointSize()
+        self.chat.setVisible(False)
+        self.chat.selectAll()
+        new_size = current_size - 1 if current_size >= 1 else 1
+        # Set the new font size for the QTextEdit widget
+        font = self.chat.currentFont()
+        font.setPointSize(int(new_size))
+        self.chat.setCurrentFont(font)
+        self.chat.setCurrentFont(font)
+        self.chat.moveCursor(QTextCursor.End)
+        self.chat.setVisible(True)
+
+    def save_chat(self):
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Save Chat", ".MD", "MD Files (*.MD);;All Files (*)"
+        )
+
+        if file_path:
+            with open(file_path, "w") as file:
+                if self.session_id is None:
+                    file.write(self.chat.toMarkdown())
+                    return
+                for turn in self.main_window.store.iter_turns(self.session_id):
+                    file.write(
+                        ChatRenderer.turn_markdown(
+                            turn["prompt"], turn["response"], turn["token_usage"]
+                        )
+                    )
+
+    def open_session(self, session_id):
+        self.session_id = session_id
+        self.oldest_turn_id = None
+        if session_id is None:
+            return
+        self.loaded = False
+        if self.isVisible():
+            self.load_session()
+
+    def load_session(self):
+        self.loaded = True
+        store = self.main_window.store
+        summary = store.load_summary(self.session_id)
+        if summary is not None:
+            self.summary_upto, self.summary = summary
+        turns = store.load_turns(self.session_id, limit=TURN_PAGE_SIZE)
+        self.prepend_turns(turns)
+        for turn in turns:
+            self.history.append(turn["raw"], turn["response"])
+        self.chat.moveCursor(QTextCursor.End)
+
+    def prepend_turns(self, turns):
+        if not turns:
+            return
+        self.oldest_turn_id = turns[0]["id"]
+        self.turns.prepend(
+            [
+                Turn(
+                    turn["id"],
+                    turn["prompt"],
+                    turn["response"],
+                    turn["prompt_tokens"],
+                    turn["response_tokens"],
+                )
+                for turn in turns
+            ]
+        )
+        self.chat_renderer.prepend_turns(
+            (turn["prompt"], turn["response"], turn["token_usage"], turn["id"])
+            for turn in turns
+        )
+        self.invalidate_context()
+
+    def load_older_turns(self, value):
+        # Page older turns in from the store when the view is scrolled to the top.
+        if value != self.chat.verticalScrollBar().minimum():
+            return
+        if self.oldest_turn_id is None or self.stream_start is not None:
+            return
+        turns = self.main_window.store.load_turns(
+            self.session_id, before_id=self.oldest_turn_id, limit=TURN_PAGE_SIZE
+        )
+        if turns:
+            self.prepend_turns(turns)
+        else:
+            self.oldest_turn_id = None
+
+    def show_turn(self, turn_id):
+        self.render_pending()
+        if self.stream_start is not None:
+            return
+        while self.oldest_turn_id is not None and self.oldest_turn_id > turn_id:
+            turns = self.main_window.store.load_turns(
+                self.session_id, before_id=self.oldest_turn_id, limit=TURN_PAGE_SIZE
+            )
+            if not turns:
+                break
+            self.prepend_turns(turns)
+        self.chat.scrollToAnchor(f"turn-{turn_id}")
+
+    def clear_chat(self):
+        self.release_task()
+        self.stream_start = None
+        self.request_status_label.setText("")
+        self.turns.clear()
+        self.summary = None
+        self.summary_upto = 0
+        self.session_id = None
+        self.oldest_turn_id = None
+        self.loaded = True
+        self.unrendered = []
+        self.history.clear()
+        self.chat_renderer.clear()
+        self.detach_files()
+        self.invalidate_context()
+
+    def release_task(self):
+        # Cancels a request in flight and stops listening to it; the window
+        # holds on to the task until the pool is done with it.
+        if self.task is None:
+            return
+        self.task.cancel()
+        self.task.signals.delta.disconnect(self.append_delta)
+        self.task.signals.completed.disconnect(self.handle_completion)
+        self.task.signals.failed.disconnect(self.handle_failure)
+        self.main_window.release_task(self.task)
+        self.task = None
+        self.submit_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+
+    def shutdown(self):
+        self.release_task()
+        if self.attachment_worker is not None:
+            self.attachment_worker.requestInterruption()
+            self.attachment_worker.wait()
+        if self.summary_task is not None:
+            self.summary_task.cancel()
+            self.summary_task.signals.completed.disconnect(self.summary_ready)
+            self.summary_task.signals.failed.disconnect(self.summary_failed)
+            self.main_window.release_task(self.summary_task)
+            self.summary_task = None
+
+    def parse_text(self):
+        self.token_counter.schedule()
+        self.main_window.warm_connections()
+
+    def submit_text(self):
+        if (
+            self.input_text_edit.toPlainText() == ""
+            or self.input_text_edit.toPlainText() == " "
+        ):
+            return
+        if self.task is not None:
+            return
+        if not self.main_window.ensure_api_key():
+            return
+
+        self.submit_started = time.perf_counter()
+        prompt = self.input_text_edit.toPlainText()
+        self.turns.ask(prompt, self.prompt_tokens(prompt))
+
+        chat_model = ChatModel()
+        messages = self.build_messages()
+        self.request_started = time.perf_counter()
+        self.first_token_time = None
+        self.request_timing = None
+        self.pending_cache_key = None
+        response_cache = self.main_window.response_cache
+        if response_cache is not None:
+            self.pending_cache_key = cache_key(self.current_model, messages, TEMPERATURE)
+            cached = response_cache.get(self.pending_cache_key)
+            self.main_window.cache_label.setText(response_cache.stats_text())
+            if cached is not None:
+                from openai.openai_object import OpenAIObject
+
+                self.pending_cache_key = None
+                self.input_text_edit.clear()
+                self.handle_completion(OpenAIObject.construct_from(cached), True)
+                return
+
+        self.stream_parts = []
+        if self.isVisible():
+            self.begin_stream_block(prompt)
+        self.request_status_label.setText(
+            self.status_text("Waiting for first token...")
+        )
+
+        self.task = CompletionTask(
+            chat_model,
+            self.main_window.OPENAI_API_KEY,
+            messages,
+            self.current_model,
+            self.stream_checkbox.isChecked(),
+            scheduler=self.main_window.scheduler,
+        )
+        self.task.setAutoDelete(False)
+        self.task.signals.delta.connect(self.append_delta)
+        self.task.signals.retrying.connect(self.show_retry)
+        self.task.signals.first_token.connect(self.show_first_token)
+        self.task.signals.timed.connect(self.show_timing)
+        self.task.signals.completed.connect(self.handle_completion)
+        self.task.signals.failed.connect(self.handle_failure)
+        self.submit_button.setEnabled(False)
+        self.stop_button.setEnabled(True)
+        self.main_window.pool.start(self.task)
+        self.input_text_edit.clear()
+
+    def prompt_tokens(self, prompt):
+        # The input box is counted in the background while it is edited, so
+        # by the time it is sent its count is normally ready.
+        counter = self.token_counter.counter
+        if counter is None:
+            return message_tokens("user", prompt)
+        return 3 + count_tokens("user") + counter.count(prompt)[0]
+
+    def invalidate_context(self):
+        self.prepared = None
+        self.prepare_timer.start()
+
+    def prepare_context(self):
+        # Everything but the prompt: which turns may go, their token totals
+        # and their JSON. The turn being answered is not part of it yet.
+        chat_model = ChatModel()
+        budget = self.token_budget_choice.value()
+        window = self.context_choice.currentIndex() + 1
+        attached = self.attached_messages()
+        end = self.turns.saved
+        full = chat_model.prepare_context(
+            self.turns, budget, window, end=end, attached=attached
+        )
+        summarized = None
+        if self.memory_checkbox.isChecked() and self.summary:
+            start = self.turns.first_after(self.summary_upto)
+            summarized = chat_model.prepare_context(
+                self.turns, budget, window, self.summary, start, end, attached
+            )
+        (summarized or full).encode()
+        self.prepared = (full, summarized)
+
+    def build_messages(self):
+        # The newest turn is the prompt being sent.
+        if self.prepared is None:
+            self.prepare_context()
+        full, summarized = self.prepared
+        prompt = self.turns.last
+        messages = full.messages(prompt)
+        context = full
+        if summarized is not None:
+            # Turns covered by the summary are left out; what the summary
+            # saves is measured against the context sent without it.
+            messages = summarized.messages(prompt)
+            context = summarized
+        self.context_report = ""
+        if self.token_budget_choice.value():
+            self.context_report = (
+                f"Context: {context.packed_messages} messages, "
+                f"{context.packed_tokens} tokens"
+            )
+        if summarized is not None:
+            saved = full.packed_tokens - summarized.packed_tokens
+            self.add_context_report(f"Memory: {saved} tokens saved")
+        if (
+            self.recall_checkbox.isChecked()
+            and self.main_window.retrieval_index is not None
+        ):
+            self.recall_turns(messages, len(context.head))
+        attached = len(context.head) - 1
+        if attached:
+            reserved = context.head_tokens - context.head[0].tokens
+            self.add_context_report(f"Attached: {attached} chunks, {reserved} tokens")
+        return messages
+
+    def attached_messages(self):
+        messages = []
+        for row in range(self.attachment_list.count()):
+            item = self.attachment_list.item(row)
+            if item.checkState() != Qt.Checked:
+                continue
+            attachment, index = item.data(Qt.UserRole)
+            try:
+                messages.append(attachment.message(index))
+            except OSError as e:
+                self.main_window.statusBar().showMessage(
+                    f"Could not read {attachment.name}: {e}", 10000
+                )
+        return messages
+
+    def attach_file(self):
+        if self.attachment_worker is not None:
+            return
+        file_path, _ = QFileDialog.getOpenFileName(
+            self,
+            "Attach File",
+            "",
+            "Text Files (*.txt *.md *.MD *.py *.json *.csv *.log);;All Files (*)",
+        )
+        if file_path:
+            self.load_attachment(file_path)
+
+    def load_attachment(self, file_path):
+        self.attach_button.setEnabled(False)
+        self.attachment_worker = AttachmentWorker(file_path, parent=self)
+        self.attachment_worker.progress.connect(self.show_attachment_progress)
+        self.attachment_worker.loaded.connect(self.add_attachment)
+        self.attachment_worker.failed.connect(self.attachment_failed)
+        self.attachment_worker.finished.connect(self.attachment_done)
+        self.attachment_worker.start()
+
+    def show_attachment_progress(self, percent):
+        self.main_window.statusBar().showMessage(
+            f"Splitting {self.attachment_worker.path}: {percent}%"
+        )
+
+    def add_attachment(self, attachment):
+        count = len(attachment.chunks)
+        self.attachment_list.blockSignals(True)
+        for index, chunk in enumerate(attachment.chunks):
+            item = QListWidgetItem(
+                f"{attachment.name} {index + 1}/{count}\t{chunk.tokens} tokens\t"
+                f"{chunk.preview}"
+            )
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            # A file that fits in one chunk is sent whole by default.
+            item.setCheckState(Qt.Checked if count == 1 else Qt.Unchecked)
+            item.setData(Qt.UserRole, (attachment, index))
+            self.attachment_list.addItem(item)
+        self.attachment_list.blockSignals(False)
+        self.attachment_panel.show()
+        self.update_attachment_label()
+        self.main_window.statusBar().showMessage(
+            f"Attached {attachment.name}: {count} chunks", 5000
+        )
+
+    def attachment_failed(self, message):
+        self.main_window.statusBar().showMessage(
+            f"Attachment failed: {message}", 10000
+        )
+
+    def attachment_done(self):
+        self.attachment_worker.deleteLater()
+        self.attachment_worker = None
+        self.attach_button.setEnabled(True)
+
+    def update_attachment_label(self):
+        chunks = tokens = 0
+        for row in range(self.attachment_list.count()):
+            item = self.attachment_list.item(row)
+            if item.checkState() == Qt.Checked:
+                attachment, index = item.data(Qt.UserRole)
+                chunks += 1
+                tokens += attachment.chunks[index].tokens
+        self.attachment_label.setText(
+            f"Attached: {chunks} of {self.attachment_list.count()} chunks selected, "
+            f"{tokens} tokens"
+        )
+        self.invalidate_context()
+
+    def detach_files(self):
+        self.attachment_list.clear()
+        self.attachment_panel.hide()
+        self.invalidate_context()
+
+    def recall_turns(self, messages, head):
+        # Relevant older turns go between the system message (and attached
+        # chunks) and the recent turns; the recent turns themselves are not
+        # recalled twice.
+        started = time.perf_counter()
+        recent_pairs = (len(messages) - head - 1) // 2
+        recent = {
+            turn.id
+            for turn in self.turns[len(self.turns) - 1 - recent_pairs : -1]
+        }
+        turn_ids, tokens = self.main_window.retrieval_index.select(
+            self.turns.last.prompt, exclude=recent
+        )
+        if turn_ids:
+            recalled = []
+            for turn in self.main_window.store.get_turns(turn_ids):
+                recalled.append({"role": "user", "content": turn["prompt"]})
+                recalled.append({"role": "assistant", "content": turn["response"]})
+            messages[head:head] = recalled
+        elapsed = (time.perf_counter() - started) * 1000
+        self.add_context_report(
+            f"Recalled: {len(turn_ids)} turns, {tokens} tokens in {elapsed:.1f} ms"
+        )
+
+    def add_context_report(self, text):
+        if self.context_report:
+            self.context_report = f"{self.context_report}, {text}"
+        else:
+            self.context_report = text
+
+    def summarize_older_turns(self):
+        # Folds everything but the newest KEEP_TURNS turns into the summary,
+        # a batch at a time, in the background. The batch comes from the
+        # store, since turns just after the summary may not be paged in.
+        if (
+            not self.memory_checkbox.isChecked()
+            or self.summary_task is not None
+            or self.session_id is None
+            or not self.main_window.OPENAI_API_KEY
+        ):
+            return
+        end = self.turns.saved - KEEP_TURNS
+        if end <= 0:
+            return
+        batch = self.main_window.store.turns_between(
+            self.session_id, self.summary_upto, self.turns[end].id, SUMMARY_BATCH
+        )
+        if len(batch) < SUMMARY_BATCH:
+            return
+        self.summary_task = SummaryTask(
+            ChatModel(),
+            self.main_window.OPENAI_API_KEY,
+            self.session_id,
+            batch[-1]["id"],
+            self.summary,
+            [turn["prompt"] for turn in batch],
+            [turn["response"] for turn in batch],
+            self.main_window.scheduler,
+        )
+        self.summary_task.signals.completed.connect(self.summary_ready)
+        self.summary_task.signals.failed.connect(self.summary_failed)
+        self.main_window.pool.start(self.summary_task)
+
+    def summary_ready(self, response):
+        task, self.summary_task = self.summary_task, None
+        summary = response.choices[0].message.content.strip()
+        self.main_window.store.save_summary(
+            task.session_id, task.upto_turn_id, summary
+        )
+        if task.session_id == self.session_id:
+            self.summary = summary
+            self.summary_upto = task.upto_turn_id
+            self.invalidate_context()
+        self.main_window.statusBar().showMessage(
+            "Conversation summary updated", 5000
+        )
+        self.summarize_older_turns()
+
+    def summary_failed(self, message):
+        self.summary_task = None
+        self.main_window.statusBar().showMessage(f"Summary failed: {message}", 10000)
+
+    def change_model(self, model):
+        self.current_model = model
+        self.main_window.update_tab(self)
+
+    def cancel_request(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.request_status_label.setText("Cancelling...")
+        for run in self.main_window.comparison_runs:
+            run.cancel()
+
+    def finish_request(self):
+        self.task = None
+        self.stream_parts = []
+        self.submit_button.setEnabled(True)
+        self.stop_button.setEnabled(bool(self.main_window.comparison_runs))
+        self.end_stream_block()
+
+    def begin_stream_block(self, prompt):
+        cursor = self.chat.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        self.stream_start = cursor.position()
+        cursor.insertBlock()
+        cursor.insertText(f"{prompt}\n\n")
+        self.chat.setTextCursor(cursor)
+
+    def append_delta(self, text):
+        self.stream_parts.append(text)
+        if self.stream_start is not None:
+            self.insert_preview(text)
+
+    def insert_preview(self, text):
+        cursor = self.chat.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        self.chat.setTextCursor(cursor)
+
+    def end_stream_block(self):
+        # The streamed text is a plain-text preview; the finished turn is
+        # rendered properly by parse_response.
+        if self.stream_start is None:
+            return
+        cursor = self.chat.textCursor()
+        cursor.setPosition(self.stream_start)
+        cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+        self.stream_start = None
+
+    def show_first_token(self, seconds):
+        self.first_token_time = seconds
+        self.request_status_label.setText(
+            self.status_text(f"Time to first token: {seconds:.2f} s")
+        )
+
+    def show_retry(self, attempt, delay, error):
+        self.request_status_label.setText(
+            self.status_text(f"Retry {attempt} in {delay:.1f} s: {error}")
+        )
+
+    def show_timing(self, timing):
+        self.request_timing = timing
+        text = self.timing_text(timing)
+        if self.first_token_time is not None:
+            text = f"Time to first token: {self.first_token_time:.2f} s\t{text}"
+        self.request_status_label.setText(self.status_text(text))
+
+    def timing_text(self, timing):
+        text = timing.summary()
+        if timing.sent_at is not None:
+            sent = (timing.sent_at - self.submit_started) * 1000
+            text = f"Submit to sent: {sent:.1f} ms\t{text}"
+        return text
+
+    def status_text(self, text):
+        return f"{self.context_report}\t{text}" if self.context_report else text
+
+    def record_metrics(self, response=None, cached=False):
+        latency = time.perf_counter() - self.request_started
+        metrics = self.main_window.metrics
+        if response is None:
+            metrics.record(self.current_model, latency, error=True)
+        else:
+            metrics.record(
+                self.current_model,
+                latency,
+                self.first_token_time,
+                response.usage.prompt_tokens,
+                response.usage.completion_tokens,
+                cached,
+            )
+        self.main_window.refresh_metrics()
+
+    def handle_completion(self, response, cached=False):
+        print(response)
+        self.finish_request()
+        self.record_metrics(response, cached)
+        content = response.choices[0].message.content
+        if response.choices[0].finish_reason == "cancelled":
+            self.pending_cache_key = None
+            if not content:
+                self.input_text_edit.setPlainText(self.turns.retract())
+                self.request_status_label.setText("Request cancelled")
+                return
+        response_cache = self.main_window.response_cache
+        if self.pending_cache_key is not None and response_cache is not None:
+            response_cache.put(self.pending_cache_key, response)
+            self.pending_cache_key = None
+
+        self.turns.last.answer(content, message_tokens("assistant", content))
+        token_usage = self.token_count(response)
+        if self.first_token_time is not None:
+            token_usage += f"Time to first token: {self.first_token_time:.2f} s\n"
+        if self.request_timing is not None:
+            token_usage += f"{self.timing_text(self.request_timing)}\n"
+        if self.context_report:
+            token_usage += f"{self.context_report}\n"
+        if cached:
+            token_usage += "Served from cache\n"
+            self.request_status_label.setText(self.status_text("Served from cache"))
+        turn_id = self.save_turn(response, token_usage)
+        self.invalidate_context()
+        self.parse_response(response, token_usage, turn_id)
+        self.history.append(response, content)
+        self.summarize_older_turns()
+
+    def save_turn(self, response, token_usage):
+        store = self.main_window.store
+        turn = self.turns.last
+        if self.session_id is None:
+            self.session_id = store.create_session(turn.prompt[:60])
+        turn.id = store.append_turn(
+            self.session_id,
+            turn.prompt,
+            turn.response,
+            token_usage,
+            json.dumps(response),
+            turn.prompt_tokens,
+            turn.response_tokens,
+        )
+        self.main_window.embed_turn(
+            turn.id, turn.tokens(), f"{turn.prompt}\n{turn.response}"
+        )
+        return turn.id
+
+    def handle_failure(self, message):
+        self.finish_request()
+        self.record_metrics()
+        self.input_text_edit.setPlainText(self.turns.retract())
+        self.request_status_label.setText("")
+        if message.startswith("Invalid API key"):
+            ChatModel.show_error(message)
+        else:
+            ChatModel.show_error(message, "Request failed")
+
+    def parse_response(self, response, token_usage, turn_id=None):
+        turn = (self.turns.last.prompt, self.turns.last.response, token_usage, turn_id)
+        if self.isVisible():
+            self.chat_renderer.append_turn(*turn)
+        else:
+            self.unrendered.append(turn)
+
+    def token_count(self, response):
+        # Get usage information from the API response
+        completion_tokens = response.usage.completion_tokens
+        prompt_tokens = response.usage.prompt_tokens
+        total_tokens = response.usage.total_tokens
+        token_usage = f"Completion tokens: {completion_tokens}\tPrompt tokens: {prompt_tokens}\nTotal tokens: {total_tokens}\n"
+        return token_usage
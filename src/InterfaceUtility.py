@@ -1,11 +1,72 @@
+import bisect
 import os
+from functools import lru_cache
 
-import openai
-from PySide6.QtCore import QObject, Qt
-from PySide6.QtWidgets import (QDialog, QDialogButtonBox, QErrorMessage,
-                               QFileDialog, QInputDialog, QLabel, QLineEdit,
-                               QListWidget, QMessageBox, QSizePolicy,
-                               QSplitter, QTextEdit, QVBoxLayout, QWidget)
+from PySide6.QtCore import QObject, Qt, QTimer
+from PySide6.QtWidgets import (QAbstractItemView, QDialog, QDialogButtonBox,
+                               QErrorMessage, QFileDialog, QHeaderView,
+                               QInputDialog, QLabel, QLineEdit, QListWidget,
+                               QMessageBox, QSizePolicy, QSplitter,
+                               QTableWidget, QTableWidgetItem, QTextEdit,
+                               QVBoxLayout, QWidget)
+
+from Conversation import Message
+from KeyPool import mask_key
+from TokenCounter import message_tokens
+
+SYSTEM_PROMPT = "You're an ML model designed to answer questions."
+TEMPERATURE = 0.6
+MODELS = ["gpt-3.5-turbo", "gpt-3.5-turbo-16k", "gpt-4", "gpt-4-32k"]
+
+
+def system_prompt(summary=None):
+    if not summary:
+        return SYSTEM_PROMPT
+    return f"{SYSTEM_PROMPT}\n\nSummary of the conversation so far:\n{summary}"
+
+
+@lru_cache(maxsize=16)
+def system_message(summary=None):
+    content = system_prompt(summary)
+    return Message("system", content, message_tokens("system", content))
+
+
+class PreparedContext:
+    # Everything a request sends except the prompt: the system message and
+    # attached chunks, then the turns that may follow them, newest first, with
+    # their running token totals. Sending a prompt only has to look up how
+    # many of those turns still fit next to it.
+    def __init__(self, head, turns, totals, token_budget=None):
+        self.head = head
+        self.head_tokens = sum(message.tokens for message in head)
+        self.turns = turns
+        self.totals = totals
+        self.token_budget = token_budget
+        self.packed_tokens = None
+        self.packed_messages = None
+
+    def encode(self):
+        # First-time JSON encoding happens here rather than when sending.
+        for message in self.head:
+            message.json()
+        for turn in self.turns:
+            for message in turn.messages():
+                message.json()
+
+    def messages(self, prompt):
+        count = len(self.turns)
+        if self.token_budget:
+            room = self.token_budget - 3 - self.head_tokens - prompt.prompt_tokens
+            count = bisect.bisect_right(self.totals, room)
+        messages = list(self.head)
+        for index in range(count - 1, -1, -1):
+            messages.extend(self.turns[index].messages())
+        messages.extend(prompt.messages())
+        self.packed_tokens = 3 + self.head_tokens + prompt.prompt_tokens
+        if count:
+            self.packed_tokens += self.totals[count - 1]
+        self.packed_messages = len(messages)
+        return messages
 
 
 class ChatInput(QTextEdit):
@@ -23,60 +84,92 @@ class ChatInput(QTextEdit):
 class ChatModel(QObject):
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.packed_tokens = None
+        self.packed_messages = None
 
-    def message_context(self, input_text: list = None, assistant_response: list = None):
-        num_inputs = len(input_text)
-        messages = [
-            {
-                "role": "system",
-                "content": "You're an ML model designed to answer questions.",
-            }
-        ]
-        for i in range(num_inputs):
-            messages.append({"role": "user", "content": input_text[i]})
-            if i < num_inputs - 1:
-                messages.append({"role": "assistant", "content": assistant_response[i]})
+    def prepare_context(
+        self,
+        turns,
+        token_budget=None,
+        window=None,
+        summary=None,
+        start=0,
+        end=None,
+        attached=(),
+    ):
+        # Turn records from start up to end, for a prompt that is not known
+        # yet: the turns before it in a window of user messages, or with a
+        # budget the newest whole turns that fit next to the system message
+        # and attachments. The prompt's share is taken off when it is sent.
+        end = len(turns) if end is None else end
+        head = [system_message(summary), *attached]
+        recent, totals = [], []
+        total = 0
+        if token_budget:
+            room = token_budget - 3 - sum(message.tokens for message in head)
+            first = start
+        else:
+            first = max(end + 1 - window, start)
+        for index in range(end - 1, first - 1, -1):
+            total += turns[index].tokens()
+            if token_budget and total > room:
+                break
+            recent.append(turns[index])
+            totals.append(total)
+        return PreparedContext(head, recent, totals, token_budget)
+
+    def turn_context(
+        self, turns, token_budget=None, window=None, summary=None, start=0
+    ):
+        # The last turn is the prompt being sent. The messages are the turns'
+        # own, so nothing is copied or re-encoded per request.
+        last = len(turns) - 1
+        context = self.prepare_context(
+            turns, token_budget, window, summary, start, last
+        )
+        messages = context.messages(turns[last])
+        if token_budget:
+            self.packed_tokens = context.packed_tokens
+            self.packed_messages = context.packed_messages
         return messages
 
-    def submit_text(
-        self, OPENAI_API_KEY, input_text, assistant_response, model="gpt-3.5-turbo"
+    def create_completion(
+        self,
+        OPENAI_API_KEY,
+        messages,
+        model="gpt-3.5-turbo",
+        stream=False,
+        temperature=TEMPERATURE,
+        timing=None,
+    ):
+        from ApiClient import get_client
+
+        return get_client(OPENAI_API_KEY).chat_completion(
+            messages, model, temperature, stream=stream, timing=timing
+        )
+
+    @staticmethod
+    def show_error(
+        text="Invalid API key. Please set one in the menu.", title="Invalid API key"
     ):
-        if OPENAI_API_KEY is None:
-            print("No API key. Please set one in the menu.")
-            error_box = QMessageBox()
-            error_box.setIcon(QMessageBox.Critical)
-            error_box.setText("Invalid API key. Please set one in the menu.")
-            error_box.setWindowTitle("Invalid API key")
-            error_box.setStandardButtons(QMessageBox.Ok)
-            error_box.exec()
-            return
-
-        openai.api_key = OPENAI_API_KEY
-        try:
-            response = openai.ChatCompletion.create(
-                model=model,
-                messages=self.message_context(input_text, assistant_response),
-                temperature=0.6,
-            )
-        except openai.error.AuthenticationError:
-            print("Invalid API key. Please set one in the menu.")
-            error_box = QMessageBox()
-            error_box.setIcon(QMessageBox.Critical)
-            error_box.setText("Invalid API key. Please set one in the menu.")
-            error_box.setWindowTitle("Invalid API key")
-            error_box.setStandardButtons(QMessageBox.Ok)
-            error_box.exec()
-            return
-        except Exception as e:
-            return f"Request failed: {e}"
-        return response
+        error_box = QMessageBox()
+        error_box.setIcon(QMessageBox.Critical)
+        error_box.setText(text)
+        error_box.setWindowTitle(title)
+        error_box.setStandardButtons(QMessageBox.Ok)
+        error_box.exec()
 
 
 class ApiWindow(QDialog):
-    def __init__(self, parent=None):
+    STATS_COLUMNS = ["Key", "Status", "Requests", "Tokens/min", "Errors", "Last error"]
+
+    def __init__(self, parent=None, key_pool=None):
         super().__init__(parent)
         self.setWindowTitle("API Key Manager")
-        self.resize(500, 300)
+        self.resize(700, 400)
+        self.key_pool = key_pool
+        self.key = None
+        self.keys = []
         self.list_widget = QListWidget()
         self.list_widget.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         if os.environ.get("OPENAI_API_KEY") and os.environ.get("OPENAI_API_KEY") != "":
@@ -95,6 +188,10 @@ class ApiWindow(QDialog):
             if self.list_widget.findItems(self.key, Qt.MatchExactly):
                 pass
             self.list_widget.addItem(self.key)
+        if key_pool is not None:
+            for key in key_pool.keys:
+                if not self.list_widget.findItems(key, Qt.MatchExactly):
+                    self.list_widget.addItem(key)
 
         button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         button_box.accepted.connect(self.handle_accept)
@@ -115,6 +212,24 @@ class ApiWindow(QDialog):
         self.text_edit = QLineEdit()
         layout.addWidget(self.list_widget)
         layout.addWidget(self.text_edit)
+        # Every key in the list is used, spread by how much of its own budget
+        # is left; the selected one is only the fallback.
+        self.stats_table = QTableWidget(0, len(self.STATS_COLUMNS))
+        self.stats_table.setHorizontalHeaderLabels(self.STATS_COLUMNS)
+        self.stats_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.stats_table.horizontalHeader().setSectionResizeMode(
+            QHeaderView.ResizeToContents
+        )
+        self.stats_table.horizontalHeader().setStretchLastSection(True)
+        self.stats_table.verticalHeader().setVisible(False)
+        self.stats_table.setVisible(key_pool is not None)
+        layout.addWidget(self.stats_table)
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setInterval(1000)
+        self.stats_timer.timeout.connect(self.update_stats)  # type: ignore
+        if key_pool is not None:
+            self.update_stats()
+            self.stats_timer.start()
         splitter.addWidget(second_button_box)
         splitter.addWidget(button_box)
         layout.addWidget(splitter)
@@ -139,6 +254,10 @@ class ApiWindow(QDialog):
             try:
                 self.key = self.get_selected_key()
                 self.key = str(self.key)
+                self.keys = [
+                    self.list_widget.item(row).text()
+                    for row in range(self.list_widget.count())
+                ]
                 self.done(QDialog.Accepted)
                 self.result()
 
@@ -152,6 +271,13 @@ class ApiWindow(QDialog):
     def result(self):
         return self.key
 
+    def update_stats(self):
+        rows = self.key_pool.stats()
+        self.stats_table.setRowCount(len(rows))
+        for row, (key, *values) in enumerate(rows):
+            for column, value in enumerate([mask_key(key), *values]):
+                self.stats_table.setItem(row, column, QTableWidgetItem(str(value)))
+
     def get_selected_key(self):
         self.selected_key = self.list_widget.selectedItems()[0].text()
         return self.selected_key
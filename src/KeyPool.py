@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import deque
+
+from RateLimiter import (RPM, TPM, RateLimiter, RequestCancelled,
+                         sleep_unless_cancelled)
+
+AUTH_EJECT_SECONDS = 600
+QUOTA_EJECT_SECONDS = 60
+THROUGHPUT_WINDOW = 60.0
+
+
+class KeysUnavailable(Exception):
+    pass
+
+
+def mask_key(key):
+    return f"{key[:3]}...{key[-4:]}" if len(key) > 12 else "*" * len(key)
+
+
+def eject_seconds(error):
+    # A key that is refused or out of quota is left out for a while; a plain
+    # rate limit only drains that key's buckets.
+    import openai
+
+    if isinstance(
+        error, (openai.error.AuthenticationError, openai.error.PermissionError)
+    ):
+        return AUTH_EJECT_SECONDS
+    if isinstance(error, openai.error.RateLimitError) and (
+        getattr(error, "code", None) == "insufficient_quota"
+        or "quota" in str(error).lower()
+    ):
+        return QUOTA_EJECT_SECONDS
+    return None
+
+
+class ApiKey:
+    def __init__(self, key, rpm, tpm):
+        self.key = key
+        self.limiter = RateLimiter(rpm, tpm)
+        self.requests = 0
+        self.errors = 0
+        self.ejected_until = 0.0
+        self.last_error = ""
+        self.usage = deque()
+
+    def tokens_per_minute(self, now):
+        while self.usage and self.usage[0][0] < now - THROUGHPUT_WINDOW:
+            self.usage.popleft()
+        return sum(tokens for _, tokens in self.usage) * 60.0 / THROUGHPUT_WINDOW
+
+
+class KeyPool:
+    def __init__(self, keys=(), rpm=RPM, tpm=TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.lock = threading.Lock()
+        self.keys = {}
+        self.set_keys(keys)
+
+    def set_keys(self, keys):
+        # Keys already in the pool keep their budgets and stats.
+        with self.lock:
+            self.keys = {
+                key: self.keys.get(key) or ApiKey(key, self.rpm, self.tpm)
+                for key in keys
+            }
+
+    def __len__(self):
+        return len(self.keys)
+
+    def acquire(self, tokens=0, cancelled=None):
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                usable = [
+                    state for state in self.keys.values() if state.ejected_until <= now
+                ]
+                if not usable:
+                    raise KeysUnavailable(self.unavailable_text(now))
+                # Most budget left first; ties go to the key that has been
+                # used least.
+                usable.sort(
+                    key=lambda state: (-state.limiter.headroom(), state.requests)
+                )
+                delay = None
+                for state in usable:
+                    wait = state.limiter.try_acquire(tokens)
+                    if wait == 0.0:
+                        state.requests += 1
+                        return state.key, waited
+                    delay = wait if delay is None else min(delay, wait)
+            if not sleep_unless_cancelled(delay, cancelled):
+                raise RequestCancelled()
+            waited += delay
+
+    def unavailable_text(self, now):
+        if not self.keys:
+            return "No API keys in the pool."
+        state = min(self.keys.values(), key=lambda state: state.ejected_until)
+        return (
+            f"All {len(self.keys)} API keys are ejected; the first is back in "
+            f"{state.ejected_until - now:.0f} s. Last error: {state.last_error}"
+        )
+
+    def record(self, key, reserved_tokens, used_tokens):
+        with self.lock:
+            state = self.keys.get(key)
+            if state is None:
+                return
+            state.usage.append((time.monotonic(), used_tokens))
+        state.limiter.adjust(used_tokens - reserved_tokens)
+
+    def failed(self, key, error):
+        import openai
+
+        seconds = eject_seconds(error)
+        with self.lock:
+            state = self.keys.get(key)
+            if state is None:
+                return False
+            state.errors += 1
+            state.last_error = str(error)
+            if seconds is not None:
+                state.ejected_until = time.monotonic() + seconds
+                # Only worth retrying if another key is still usable.
+                return any(
+                    other.ejected_until <= time.monotonic()
+                    for other in self.keys.values()
+                )
+        if isinstance(error, openai.error.RateLimitError):
+            state.limiter.drain()
+        return False
+
+    def stats(self):
+        rows = []
+        with self.lock:
+            now = time.monotonic()
+            for state in self.keys.values():
+                if state.ejected_until > now:
+                    status = f"Ejected {state.ejected_until - now:.0f} s"
+                else:
+                    status = f"{state.limiter.headroom():.0%} left"
+                rows.append(
+                    (
+                        state.key,
+                        status,
+                        state.requests,
+                        round(state.tokens_per_minute(now)),
+                        state.errors,
+                        state.last_error,
+                    )
+                )
+        return rows
+
+    def summary(self):
+        with self.lock:
+            now = time.monotonic()
+            active = sum(
+                state.ejected_until <= now for state in self.keys.values()
+            )
+            return f"Keys: {active}/{len(self.keys)} active"
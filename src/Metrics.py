@@ -0,0 +1,226 @@
+import csv
+import math
+import time
+from array import array
+
+from PySide6.QtWidgets import (QFileDialog, QHBoxLayout, QLabel, QPushButton,
+                               QTableWidget, QTableWidgetItem, QVBoxLayout,
+                               QWidget)
+
+CACHE_HIT = 1
+ERROR = 2
+FIELDS = [
+    "timestamp",
+    "model",
+    "latency",
+    "time_to_first_token",
+    "prompt_tokens",
+    "completion_tokens",
+    "tokens_per_second",
+    "cache_hit",
+    "error",
+]
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def percentile(values, quantile):
+    # Nearest-rank percentile of an already sorted list.
+    if not values:
+        return math.nan
+    return values[max(math.ceil(quantile * len(values)) - 1, 0)]
+
+
+class MetricsRecorder:
+    def __init__(self, capacity=10000):
+        # Parallel typed arrays used as a ring buffer keep each record to a
+        # few dozen bytes instead of a dict per request.
+        self.capacity = capacity
+        self.timestamps = array("d", [0.0]) * capacity
+        self.latencies = array("d", [0.0]) * capacity
+        self.first_tokens = array("d", [0.0]) * capacity
+        self.prompt_tokens = array("l", [0]) * capacity
+        self.completion_tokens = array("l", [0]) * capacity
+        self.models = array("H", [0]) * capacity
+        self.flags = array("B", [0]) * capacity
+        self.model_names = []
+        self.next = 0
+        self.size = 0
+        self.totals = {
+            "requests": 0,
+            "errors": 0,
+            "cache_hits": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "latency": 0.0,
+        }
+
+    def model_index(self, model):
+        try:
+            return self.model_names.index(model)
+        except ValueError:
+            self.model_names.append(model)
+            return len(self.model_names) - 1
+
+    def record(
+        self,
+        model,
+        latency,
+        time_to_first_token=None,
+        prompt_tokens=0,
+        completion_tokens=0,
+        cache_hit=False,
+        error=False,
+    ):
+        i = self.next
+        self.timestamps[i] = time.time()
+        self.latencies[i] = latency
+        self.first_tokens[i] = (
+            math.nan if time_to_first_token is None else time_to_first_token
+        )
+        self.prompt_tokens[i] = prompt_tokens or 0
+        self.completion_tokens[i] = completion_tokens or 0
+        self.models[i] = self.model_index(model)
+        self.flags[i] = (CACHE_HIT if cache_hit else 0) | (ERROR if error else 0)
+        self.next = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+        self.totals["requests"] += 1
+        self.totals["errors"] += bool(error)
+        self.totals["cache_hits"] += bool(cache_hit)
+        self.totals["prompt_tokens"] += prompt_tokens or 0
+        self.totals["completion_tokens"] += completion_tokens or 0
+        self.totals["latency"] += latency
+
+    def indexes(self):
+        start = (self.next - self.size) % self.capacity
+        return [(start + offset) % self.capacity for offset in range(self.size)]
+
+    def tokens_per_second(self, i):
+        generating = self.latencies[i]
+        if not math.isnan(self.first_tokens[i]):
+            generating -= self.first_tokens[i]
+        if generating <= 0 or not self.completion_tokens[i]:
+            return math.nan
+        return self.completion_tokens[i] / generating
+
+    def rows(self):
+        for i in self.indexes():
+            yield [
+                self.timestamps[i],
+                self.model_names[self.models[i]],
+                self.latencies[i],
+                self.first_tokens[i],
+                self.prompt_tokens[i],
+                self.completion_tokens[i],
+                self.tokens_per_second(i),
+                bool(self.flags[i] & CACHE_HIT),
+                bool(self.flags[i] & ERROR),
+            ]
+
+    def distributions(self):
+        # Latency percentiles cover every request; first-token time and
+        # throughput only cover requests that actually reached the API.
+        latency, first_token, throughput = [], [], []
+        for i in self.indexes():
+            latency.append(self.latencies[i])
+            if self.flags[i]:
+                continue
+            if not math.isnan(self.first_tokens[i]):
+                first_token.append(self.first_tokens[i])
+            rate = self.tokens_per_second(i)
+            if not math.isnan(rate):
+                throughput.append(rate)
+        return {
+            "latency_seconds": sorted(latency),
+            "time_to_first_token_seconds": sorted(first_token),
+            "tokens_per_second": sorted(throughput),
+        }
+
+    def write_csv(self, file):
+        writer = csv.writer(file)
+        writer.writerow(FIELDS)
+        for row in self.rows():
+            writer.writerow(["" if value != value else value for value in row])
+
+    def prometheus_text(self, prefix="gpta"):
+        lines = []
+        for name, values in self.distributions().items():
+            metric = f"{prefix}_{name}"
+            lines.append(f"# TYPE {metric} summary")
+            for quantile in QUANTILES:
+                lines.append(
+                    f'{metric}{{quantile="{quantile}"}} {percentile(values, quantile)}'
+                )
+            lines.append(f"{metric}_sum {sum(values)}")
+            lines.append(f"{metric}_count {len(values)}")
+        for name in self.totals:
+            if name == "latency":
+                continue
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {self.totals[name]}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        with open(path, "w", newline="") as file:
+            if path.lower().endswith(".csv"):
+                self.write_csv(file)
+            else:
+                file.write(self.prometheus_text())
+
+
+class MetricsPanel(QWidget):
+    def __init__(self, recorder, parent=None):
+        super().__init__(parent)
+        self.recorder = recorder
+        self.totals_label = QLabel()
+        self.totals_label.setWordWrap(True)
+        self.table = QTableWidget(3, len(QUANTILES) + 1)
+        self.table.setHorizontalHeaderLabels(
+            [f"p{int(quantile * 100)}" for quantile in QUANTILES] + ["samples"]
+        )
+        self.table.setVerticalHeaderLabels(
+            ["Latency (s)", "First token (s)", "Tokens/s"]
+        )
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+
+        export_csv = QPushButton("Export CSV")
+        export_csv.clicked.connect(lambda: self.export("CSV Files (*.csv)", ".csv"))
+        export_prometheus = QPushButton("Export Prometheus")
+        export_prometheus.clicked.connect(
+            lambda: self.export("Prometheus Text (*.prom);;All Files (*)", ".prom")
+        )
+        buttons = QHBoxLayout()
+        buttons.addWidget(export_csv)
+        buttons.addWidget(export_prometheus)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.totals_label)
+        layout.addWidget(self.table)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+        self.refresh()
+
+    def refresh(self):
+        totals = self.recorder.totals
+        requests = totals["requests"]
+        self.totals_label.setText(
+            f"Requests: {requests}\tErrors: {totals['errors']}\t"
+            f"Cache hits: {totals['cache_hits']}\n"
+            f"Prompt tokens: {totals['prompt_tokens']}\t"
+            f"Completion tokens: {totals['completion_tokens']}\t"
+            f"Mean latency: {totals['latency'] / requests if requests else 0:.2f} s"
+        )
+        for row, values in enumerate(self.recorder.distributions().values()):
+            for column, quantile in enumerate(QUANTILES):
+                value = percentile(values, quantile)
+                text = "" if math.isnan(value) else f"{value:.2f}"
+                self.table.setItem(row, column, QTableWidgetItem(text))
+            self.table.setItem(row, len(QUANTILES), QTableWidgetItem(str(len(values))))
+
+    def export(self, filter, suffix):
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Export Metrics", f"metrics{suffix}", filter
+        )
+        if file_path:
+            self.recorder.export(file_path)
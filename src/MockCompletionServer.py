@@ -0,0 +1,130 @@
+import argparse
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from TokenCounter import count_message_tokens, get_encoding
+
+
+class MockCompletionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    first_token_delay = 0.2
+    token_delay = 0.02
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply_text(self, messages):
+        prompt = messages[-1]["content"] if messages else ""
+        return f"This is a mock reply to: {prompt}"
+
+    def do_GET(self):
+        # Only the model list, which clients use to open a connection early.
+        models = [{"id": "gpt-3.5-turbo", "object": "model"}]
+        body = json.dumps({"object": "list", "data": models}).encode()
+        self.send_response(200 if self.path.endswith("/models") else 404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        messages = request.get("messages", [])
+        model = request.get("model", "gpt-3.5-turbo")
+        content = self.reply_text(messages)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        time.sleep(self.first_token_delay)
+
+        if not request.get("stream"):
+            prompt_tokens = count_message_tokens(messages)
+            completion_tokens = len(get_encoding().encode_ordinary(content))
+            body = json.dumps(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                }
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        deltas = [{"role": "assistant"}]
+        deltas += [{"content": piece} for piece in content.split(" ") if piece]
+        for i, delta in enumerate(deltas):
+            if i > 1:
+                delta["content"] = " " + delta["content"]
+                time.sleep(self.token_delay)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+            }
+            if not self.send_event(json.dumps(chunk)):
+                return
+        finish = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        self.send_event(json.dumps(finish))
+        self.send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_event(self, data):
+        payload = f"data: {data}\n\n".encode()
+        try:
+            self.wfile.write(f"{len(payload):X}\r\n".encode() + payload + b"\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return False
+        return True
+
+
+def serve(host="127.0.0.1", port=8000, first_token_delay=0.2, token_delay=0.02):
+    MockCompletionHandler.first_token_delay = first_token_delay
+    MockCompletionHandler.token_delay = token_delay
+    return ThreadingHTTPServer((host, port), MockCompletionHandler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the chat completions endpoint."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    args = parser.parse_args()
+    server = serve(args.host, args.port, args.first_token_delay, args.token_delay)
+    print(f"Serving mock completions on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,181 @@
+import time
+
+from PySide6.QtCore import QObject, Qt, QThreadPool, Signal
+from PySide6.QtGui import QTextCursor
+from PySide6.QtWidgets import (QAbstractItemView, QDialog, QDialogButtonBox,
+                               QFormLayout, QLabel, QLineEdit, QListWidget,
+                               QSpinBox, QTextBrowser, QVBoxLayout, QWidget)
+
+from ChatWorker import CompletionTask
+from InterfaceUtility import MODELS, TEMPERATURE
+
+
+class ComparisonDialog(QDialog):
+    def __init__(self, current_model, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Compare Models")
+        self.model_list = QListWidget()
+        self.model_list.setSelectionMode(QAbstractItemView.MultiSelection)
+        self.model_list.addItems(MODELS)
+        for item in self.model_list.findItems(current_model, Qt.MatchExactly):
+            item.setSelected(True)
+        self.temperatures = QLineEdit(str(TEMPERATURE))
+        self.temperatures.setToolTip("Comma separated, e.g. 0.2, 0.6, 1.0")
+        self.max_workers = QSpinBox()
+        self.max_workers.setRange(1, 16)
+        self.max_workers.setValue(4)
+
+        form = QFormLayout()
+        form.addRow("Temperatures:", self.temperatures)
+        form.addRow("Concurrent requests:", self.max_workers)
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+        layout = QVBoxLayout()
+        layout.addWidget(QLabel("Models:"))
+        layout.addWidget(self.model_list)
+        layout.addLayout(form)
+        layout.addWidget(button_box)
+        self.setLayout(layout)
+
+    def variants(self):
+        temperatures = []
+        for value in self.temperatures.text().split(","):
+            try:
+                temperatures.append(min(max(float(value), 0.0), 2.0))
+            except ValueError:
+                continue
+        temperatures = temperatures or [TEMPERATURE]
+        models = [item.text() for item in self.model_list.selectedItems()]
+        return [(model, temperature) for model in models for temperature in temperatures]
+
+
+class ComparisonPane(QWidget):
+    def __init__(self, model, temperature, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.temperature = temperature
+        self.first_token_time = None
+        self.timing = None
+        self.stats_label = QLabel(f"{model} @ {temperature}: waiting...")
+        self.stats_label.setWordWrap(True)
+        self.browser = QTextBrowser()
+        self.browser.setReadOnly(True)
+        layout = QVBoxLayout()
+        layout.addWidget(self.stats_label)
+        layout.addWidget(self.browser)
+        self.setLayout(layout)
+
+    def append_delta(self, text):
+        cursor = QTextCursor(self.browser.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+
+    def show_first_token(self, seconds):
+        self.first_token_time = seconds
+        self.stats_label.setText(
+            f"{self.model} @ {self.temperature}: first token in {seconds:.2f} s"
+        )
+
+    def show_retry(self, attempt, delay, error):
+        self.stats_label.setText(
+            f"{self.model} @ {self.temperature}: "
+            f"retry {attempt} in {delay:.1f} s ({error})"
+        )
+
+    def show_timing(self, timing):
+        self.timing = timing
+
+    def show_result(self, response):
+        import markdown2
+
+        self.browser.setHtml(markdown2.markdown(response.choices[0].message.content))
+        usage = response.usage
+        stats = [f"{self.model} @ {self.temperature}"]
+        if self.first_token_time is not None:
+            stats.append(f"first token {self.first_token_time:.2f} s")
+        if self.timing is not None and self.timing.total is not None:
+            stats.append(f"latency {self.timing.total:.2f} s")
+        stats.append(
+            f"{usage.prompt_tokens} prompt + {usage.completion_tokens} completion tokens"
+        )
+        if response.choices[0].finish_reason == "cancelled":
+            stats.append("cancelled")
+        self.stats_label.setText(", ".join(stats))
+
+    def show_error(self, message):
+        self.stats_label.setText(f"{self.model} @ {self.temperature}: {message}")
+
+
+class ComparisonRun(QObject):
+    finished = Signal()
+
+    def __init__(
+        self,
+        chat_model,
+        api_key,
+        messages,
+        variants,
+        max_workers=4,
+        stream=True,
+        parent=None,
+        scheduler=None,
+        metrics=None,
+    ):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_workers)
+        self.metrics = metrics
+        self.started = None
+        self.panes = []
+        self.tasks = []
+        self.remaining = len(variants)
+        for model, temperature in variants:
+            pane = ComparisonPane(model, temperature)
+            task = CompletionTask(
+                chat_model, api_key, messages, model, stream, temperature, scheduler
+            )
+            task.setAutoDelete(False)
+            task.signals.delta.connect(pane.append_delta)
+            task.signals.first_token.connect(pane.show_first_token)
+            task.signals.retrying.connect(pane.show_retry)
+            task.signals.timed.connect(pane.show_timing)
+            task.signals.completed.connect(pane.show_result)
+            task.signals.failed.connect(pane.show_error)
+            task.signals.completed.connect(
+                lambda response, pane=pane: self.record(pane, response)
+            )
+            task.signals.failed.connect(lambda _, pane=pane: self.record(pane))
+            task.signals.completed.connect(self.task_done)
+            task.signals.failed.connect(self.task_done)
+            self.panes.append(pane)
+            self.tasks.append(task)
+
+    def start(self):
+        self.started = time.perf_counter()
+        for task in self.tasks:
+            self.pool.start(task)
+
+    def cancel(self):
+        for task in self.tasks:
+            task.cancel()
+
+    def record(self, pane, response=None):
+        if self.metrics is None:
+            return
+        latency = time.perf_counter() - self.started
+        if response is None:
+            self.metrics.record(pane.model, latency, error=True)
+            return
+        self.metrics.record(
+            pane.model,
+            latency,
+            pane.first_token_time,
+            response.usage.prompt_tokens,
+            response.usage.completion_tokens,
+        )
+
+    def task_done(self, *args):
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.finished.emit()
@@ -0,0 +1,231 @@
+import os
+import random
+import threading
+import time
+
+RPM = int(os.environ.get("OPENAI_RPM", 3500))
+TPM = int(os.environ.get("OPENAI_TPM", 90000))
+
+
+class RequestCancelled(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        # A request larger than the whole bucket is let through once the bucket
+        # is full, otherwise it could never run.
+        needed = min(amount, self.capacity) - self.level
+        return max(needed, 0.0) / self.rate
+
+
+class RateLimiter:
+    def __init__(self, rpm=None, tpm=None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.lock = threading.Lock()
+
+    def try_acquire(self, tokens=0):
+        # Takes one request and the tokens if both are available now, and
+        # otherwise says how long until they will be.
+        with self.lock:
+            now = time.monotonic()
+            delay = 0.0
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    delay = max(delay, bucket.wait_time(amount))
+            if delay == 0.0:
+                if self.requests is not None:
+                    self.requests.level -= 1
+                if self.tokens is not None:
+                    self.tokens.level -= tokens
+            return delay
+
+    def acquire(self, tokens=0, cancelled=None):
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(tokens)
+            if delay == 0.0:
+                return waited
+            if not sleep_unless_cancelled(delay, cancelled):
+                raise RequestCancelled()
+            waited += delay
+
+    def headroom(self):
+        # The share of the budget left in whichever bucket is emptier.
+        with self.lock:
+            now = time.monotonic()
+            share = 1.0
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.refill(now)
+                    share = min(share, bucket.level / bucket.capacity)
+            return share
+
+    def adjust(self, tokens):
+        # Charge (or refund) the difference between the tokens reserved up
+        # front and what the response reports it actually used.
+        if self.tokens is None or not tokens:
+            return
+        with self.lock:
+            self.tokens.refill(time.monotonic())
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level - tokens)
+
+    def drain(self):
+        # After the server says we are over a limit, make everyone wait for
+        # the buckets to refill rather than piling more requests on.
+        with self.lock:
+            now = time.monotonic()
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.refill(now)
+                    bucket.level = min(bucket.level, 0.0)
+
+
+def is_retryable(error):
+    import openai
+
+    if isinstance(
+        error,
+        (
+            openai.error.RateLimitError,
+            openai.error.ServiceUnavailableError,
+            openai.error.APIConnectionError,
+            openai.error.Timeout,
+            openai.error.TryAgain,
+        ),
+    ):
+        return True
+    return isinstance(error, openai.error.APIError) and (error.http_status or 0) >= 500
+
+
+def retry_after(error):
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    # With a KeyPool, each request runs on the key with the most budget left
+    # and the pool's per-key limits replace the shared one.
+    def __init__(
+        self,
+        rpm=None,
+        tpm=None,
+        max_retries=5,
+        base_delay=1.0,
+        max_delay=60.0,
+        keys=None,
+    ):
+        self.limiter = RateLimiter(rpm, tpm)
+        self.keys = keys
+        # The key the current thread's last request ran on, for record_usage.
+        self.local = threading.local()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.retries = 0
+        self.last_wait = 0.0
+        self.total_wait = 0.0
+
+    def backoff(self, attempt, error):
+        # Exponential backoff with full jitter, unless the server said when.
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        return delay
+
+    def run(self, call, prompt_tokens=0, cancelled=None, on_retry=None):
+        # call is given the API key to use, or None when there is no key pool.
+        import openai
+
+        attempt = 0
+        while True:
+            keys = self.keys
+            key = None
+            with self.lock:
+                self.queued += 1
+            try:
+                if keys is None:
+                    waited = self.limiter.acquire(prompt_tokens, cancelled)
+                else:
+                    key, waited = keys.acquire(prompt_tokens, cancelled)
+            finally:
+                with self.lock:
+                    self.queued -= 1
+            self.local.keys = keys
+            self.local.key = key
+            with self.lock:
+                self.running += 1
+                self.last_wait = waited
+                self.total_wait += waited
+            try:
+                return call(key)
+            except Exception as e:
+                ejected = key is not None and keys.failed(key, e)
+                if (
+                    attempt >= self.max_retries
+                    or not (ejected or is_retryable(e))
+                    or (cancelled is not None and cancelled())
+                ):
+                    raise
+                error = e
+            finally:
+                with self.lock:
+                    self.running -= 1
+
+            if key is None and isinstance(error, openai.error.RateLimitError):
+                self.limiter.drain()
+            # Another key can take the request straight away.
+            delay = 0.0 if ejected else self.backoff(attempt, error)
+            attempt += 1
+            with self.lock:
+                self.retries += 1
+            if on_retry is not None:
+                on_retry(attempt, delay, str(error))
+            if not sleep_unless_cancelled(delay, cancelled):
+                raise RequestCancelled()
+
+    def record_usage(self, reserved_tokens, used_tokens):
+        key = getattr(self.local, "key", None)
+        if key is None:
+            self.limiter.adjust(used_tokens - reserved_tokens)
+        else:
+            self.local.keys.record(key, reserved_tokens, used_tokens)
+
+    def stats_text(self):
+        with self.lock:
+            text = (
+                f"Queued: {self.queued}\tIn flight: {self.running}\t"
+                f"Last wait: {self.last_wait:.1f} s\tRetries: {self.retries}"
+            )
+        if self.keys is not None:
+            text = f"{text}\t{self.keys.summary()}"
+        return text
+
+
+def sleep_unless_cancelled(delay, cancelled, step=0.1):
+    deadline = time.monotonic() + delay
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return True
+        if cancelled is not None and cancelled():
+            return False
+        time.sleep(min(step, remaining))
@@ -0,0 +1,133 @@
+import json
+
+from PySide6.QtCore import QAbstractListModel, QModelIndex, Qt
+from PySide6.QtWidgets import QListView, QPlainTextEdit, QSplitter
+
+
+def first_message(record):
+    return ((record.get("choices") or [{}])[0]).get("message")
+
+
+def summarize(record):
+    choice = (record.get("choices") or [{}])[0]
+    usage = record.get("usage") or {}
+    content = " ".join(((choice.get("message") or {}).get("content") or "").split())
+    return (
+        f"{record.get('model', '?')}  {choice.get('finish_reason') or '-'}  "
+        f"{usage.get('total_tokens', '?')} tokens  {content[:80]}"
+    )
+
+
+class RawHistoryModel(QAbstractListModel):
+    def __init__(self, max_records=10000, parent=None):
+        super().__init__(parent)
+        # Each row holds a one-line summary, the response as compact JSON
+        # without the reply text, and the reply text itself, which is the
+        # string the conversation already holds rather than a copy. The full
+        # JSON is only put back together for the row being looked at.
+        self.max_records = max_records
+        self.records = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.records[index.row()][0]
+        if role == Qt.ToolTipRole:
+            return "Select to show the full response"
+        return None
+
+    def append(self, response, content=None):
+        # Accepts a response object or the JSON text saved in the store.
+        if not isinstance(response, str):
+            response = json.dumps(response)
+        response = json.loads(response)
+        summary = summarize(response)
+        message = first_message(response)
+        if message is not None:
+            if content is None:
+                content = message.get("content")
+            message["content"] = None
+        raw = json.dumps(response, separators=(",", ":"))
+        if len(self.records) >= self.max_records:
+            self.beginRemoveRows(QModelIndex(), 0, 0)
+            del self.records[0]
+            self.endRemoveRows()
+        row = len(self.records)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.records.append((summary, raw, content))
+        self.endInsertRows()
+
+    def record(self, row):
+        _, raw, content = self.records[row]
+        record = json.loads(raw)
+        message = first_message(record)
+        if message is not None:
+            message["content"] = content
+        return record
+
+    def pretty(self, row):
+        return json.dumps(self.record(row), indent=4)
+
+    def clear(self):
+        self.beginResetModel()
+        self.records = []
+        self.endResetModel()
+
+    def export(self, path):
+        # Written record by record as one JSON array, never as a single string.
+        with open(path, "w") as file:
+            file.write("[")
+            for row in range(len(self.records)):
+                file.write(",\n" if row else "\n")
+                file.write(json.dumps(self.record(row), separators=(",", ":")))
+            file.write("\n]\n")
+
+
+class RawHistoryView(QSplitter):
+    def __init__(self, model, font=None, parent=None):
+        super().__init__(Qt.Vertical, parent)
+        self.model = model
+        self.list_view = QListView()
+        self.list_view.setModel(model)
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setAlternatingRowColors(True)
+        self.detail = QPlainTextEdit()
+        self.detail.setReadOnly(True)
+        self.detail.setPlaceholderText("Select a raw response to see it in full")
+        if font is not None:
+            self.list_view.setFont(font)
+            self.detail.setFont(font)
+        self.addWidget(self.list_view)
+        self.addWidget(self.detail)
+        self.setSizes([300, 500])
+        self.list_view.selectionModel().currentRowChanged.connect(self.expand)
+        model.rowsInserted.connect(self.follow)
+        model.modelReset.connect(self.detail.clear)
+
+    def set_model(self, model):
+        if model is self.model:
+            return
+        self.model.rowsInserted.disconnect(self.follow)
+        self.model.modelReset.disconnect(self.detail.clear)
+        selection_model = self.list_view.selectionModel()
+        self.model = model
+        self.list_view.setModel(model)
+        selection_model.deleteLater()
+        self.list_view.selectionModel().currentRowChanged.connect(self.expand)
+        model.rowsInserted.connect(self.follow)
+        model.modelReset.connect(self.detail.clear)
+        self.detail.clear()
+
+    def expand(self, current, previous):
+        if current.isValid():
+            self.detail.setPlainText(self.model.pretty(current.row()))
+        else:
+            self.detail.clear()
+
+    def follow(self, parent, first, last):
+        if not self.list_view.currentIndex().isValid():
+            self.list_view.scrollToBottom()
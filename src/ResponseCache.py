@@ -0,0 +1,118 @@
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+
+from Conversation import encode_messages
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_by_use ON responses (last_used);
+"""
+
+
+def cache_key(model, messages, temperature):
+    # Spelled out in sorted-key order so each message's own encoding is
+    # reused; the result matches json.dumps(..., sort_keys=True).
+    payload = (
+        f'{{"messages":{encode_messages(messages)},'
+        f'"model":{json.dumps(model)},"temperature":{json.dumps(temperature)}}}'
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path="response_cache.db",
+        max_entries=256,
+        max_disk_entries=10000,
+        max_age=7 * 24 * 60 * 60,
+    ):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_age = max_age
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path) if path else None
+        if self.connection is not None:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(SCHEMA)
+
+    def get(self, key):
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is not None:
+            created, response = entry
+            if now - created <= self.max_age:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return response
+            del self.entries[key]
+
+        if self.connection is not None:
+            row = self.connection.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] <= self.max_age:
+                with self.connection:
+                    self.connection.execute(
+                        "UPDATE responses SET last_used = ? WHERE key = ?", (now, key)
+                    )
+                response = json.loads(row[0])
+                self.remember(key, row[1], response)
+                self.hits += 1
+                self.disk_hits += 1
+                return response
+
+        self.misses += 1
+        return None
+
+    def put(self, key, response):
+        now = time.time()
+        self.remember(key, now, response)
+        if self.connection is None:
+            return
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, last_used)"
+                " VALUES (?, ?, ?, ?)",
+                (key, json.dumps(response), now, now),
+            )
+            self.connection.execute(
+                "DELETE FROM responses WHERE created < ?", (now - self.max_age,)
+            )
+            self.connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses"
+                " ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,),
+            )
+
+    def remember(self, key, created, response):
+        self.entries[key] = (created, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats_text(self):
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups * 100 if lookups else 0
+        return f"Cache: {self.hits} hits ({self.disk_hits} from disk), {self.misses} misses, {rate:.0f}% hit rate"
+
+    def clear(self):
+        self.entries.clear()
+        if self.connection is not None:
+            with self.connection:
+                self.connection.execute("DELETE FROM responses")
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
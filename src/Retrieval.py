@@ -0,0 +1,68 @@
+import math
+import re
+import zlib
+from collections import Counter
+
+from PySide6.QtCore import QThread, Signal
+
+from ConversationStore import ConversationStore
+
+# numpy is only imported with TurnIndex, on the indexer thread, so importing
+# this module does not slow down startup.
+DIMENSIONS = 512
+TOP_K = 4
+TOKEN_BUDGET = 1000
+MIN_SCORE = 0.2
+WORD = re.compile(r"\w\w+")
+
+
+def hashed_features(text):
+    # Each word lands in one of DIMENSIONS buckets with a +1/-1 sign, so
+    # colliding words tend to cancel out instead of adding up.
+    features = []
+    for word, count in Counter(WORD.findall(text.lower())).items():
+        digest = zlib.crc32(word.encode())
+        sign = 1.0 if digest & 0x80000000 else -1.0
+        features.append((digest % DIMENSIONS, sign * (1.0 + math.log(count))))
+    return features
+
+
+class RetrievalIndexer(QThread):
+    progress = Signal(int)
+    ready = Signal(object)
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+
+    def run(self):
+        # Vectors are computed once per turn and kept in the store; only turns
+        # saved since the last run need embedding.
+        from TurnIndex import TurnIndex
+
+        store = ConversationStore(self.path)
+        index = TurnIndex()
+        try:
+            index.load(store.load_vectors())
+            embedded = 0
+            while not self.isInterruptionRequested():
+                turns = store.unembedded_turns()
+                if not turns:
+                    break
+                store.save_vectors(
+                    (
+                        turn["id"],
+                        index.add(
+                            turn["id"],
+                            turn["tokens"],
+                            f"{turn['prompt']}\n{turn['response']}",
+                        ).tobytes(),
+                    )
+                    for turn in turns
+                )
+                embedded += len(turns)
+                self.progress.emit(embedded)
+        finally:
+            store.close()
+        if not self.isInterruptionRequested():
+            self.ready.emit(index)
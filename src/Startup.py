@@ -0,0 +1,76 @@
+import time
+
+from PySide6.QtCore import QThread, Signal
+
+
+def warm_api_client():
+    import ApiClient  # noqa: F401
+
+
+def warm_tokenizer():
+    from TokenCounter import get_encoding
+
+    get_encoding().encode_ordinary("warm up")
+
+
+def warm_markdown():
+    import markdown2
+
+    markdown2.markdown("warm *up*")
+
+
+WARMUP_STEPS = [
+    ("API client", warm_api_client),
+    ("tokenizer", warm_tokenizer),
+    ("markdown", warm_markdown),
+]
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.steps = []
+        self.components = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.steps.append((name, now - self.last, now - self.started))
+        self.last = now
+
+    def record(self, name, duration):
+        # Components are warmed in the background, alongside the marked steps.
+        self.components.append((name, duration))
+
+    def elapsed(self, name):
+        for step, _, since_start in self.steps:
+            if step == name:
+                return since_start
+        return None
+
+    def summary(self):
+        components = ", ".join(
+            f"{name} {duration * 1000:.0f} ms" for name, duration in self.components
+        )
+        return (
+            f"Window in {self.elapsed('window shown'):.2f} s, "
+            f"ready in {self.elapsed('ready'):.2f} s ({components})"
+        )
+
+
+class WarmupWorker(QThread):
+    component_ready = Signal(str, float)
+    failed = Signal(str, str)
+
+    def __init__(self, steps=WARMUP_STEPS, parent=None):
+        super().__init__(parent)
+        self.steps = steps
+
+    def run(self):
+        for name, step in self.steps:
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                self.failed.emit(name, str(e))
+            self.component_ready.emit(name, time.perf_counter() - started)
@@ -0,0 +1,190 @@
+import bisect
+import re
+import threading
+from functools import lru_cache
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, QTimer, Signal
+
+# A position right after a line break and before non-whitespace always starts a
+# new tiktoken pre-tokenizer piece (and a new word), so the text can be cut into
+# blocks there and the counts of each block summed.
+BLOCK_BOUNDARY = re.compile(r"(?<=[\r\n])(?=\S)")
+COMPARE_CHUNK = 1 << 16
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name="cl100k_base"):
+    import tiktoken
+
+    return tiktoken.get_encoding(name)
+
+
+def format_counts(num_tokens, num_words, num_chars):
+    return f"Token count: {num_tokens}\tWord count: {num_words},\tCharacter count: {num_chars}"
+
+
+def count_tokens(text, model="cl100k_base"):
+    return len(get_encoding(model).encode_ordinary(text))
+
+
+def message_tokens(role, content, model="cl100k_base"):
+    # Chat models wrap every message in a few formatting tokens.
+    return 3 + count_tokens(role, model) + count_tokens(content, model)
+
+
+def count_message_tokens(messages, model="cl100k_base"):
+    # The reply is primed with three more tokens. Messages built from turns
+    # carry their count already.
+    return 3 + sum(
+        getattr(message, "tokens", None)
+        or message_tokens(message["role"], message["content"], model)
+        for message in messages
+    )
+
+
+def common_prefix_length(a, b):
+    limit = min(len(a), len(b))
+    start = 0
+    while start < limit:
+        end = min(start + COMPARE_CHUNK, limit)
+        if a[start:end] != b[start:end]:
+            lo, hi = start, end
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if a[start:mid] == b[start:mid]:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            return lo
+        start = end
+    return limit
+
+
+def common_suffix_length(a, b, limit):
+    len_a, len_b = len(a), len(b)
+    done = 0
+    while done < limit:
+        size = min(done + COMPARE_CHUNK, limit)
+        if a[len_a - size : len_a - done] != b[len_b - size : len_b - done]:
+            lo, hi = done, size
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if a[len_a - mid : len_a - done] == b[len_b - mid : len_b - done]:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            return lo
+        done = size
+    return limit
+
+
+class TokenCounter:
+    def __init__(self, model="cl100k_base"):
+        self.encoding = get_encoding(model)
+        self.lock = threading.Lock()
+        self.text = ""
+        self.block_starts = []
+        self.block_tokens = []
+        self.block_words = []
+        self.num_tokens = 0
+        self.num_words = 0
+
+    def count(self, text):
+        with self.lock:
+            if text != self.text:
+                self.update(text)
+            return self.num_tokens, self.num_words, len(text)
+
+    def measure(self, text, offset=0):
+        starts, tokens, words = [], [], []
+        position = offset
+        for block in BLOCK_BOUNDARY.split(text):
+            if not block:
+                continue
+            starts.append(position)
+            tokens.append(len(self.encoding.encode_ordinary(block)))
+            words.append(len(block.split()))
+            position += len(block)
+        return starts, tokens, words
+
+    def update(self, text):
+        old = self.text
+        if not self.block_starts:
+            self.block_starts, self.block_tokens, self.block_words = self.measure(text)
+            self.num_tokens = sum(self.block_tokens)
+            self.num_words = sum(self.block_words)
+            self.text = text
+            return
+
+        prefix = common_prefix_length(old, text)
+        suffix = common_suffix_length(old, text, min(len(old), len(text)) - prefix)
+        delta = len(text) - len(old)
+
+        # Re-measure from the last boundary whose neighbouring characters are
+        # both untouched, up to the first such boundary after the edit.
+        first = max(bisect.bisect_right(self.block_starts, prefix - 1) - 1, 0)
+        last = bisect.bisect_left(self.block_starts, len(old) - suffix + 1)
+        start = self.block_starts[first]
+        end = self.block_starts[last] + delta if last < len(self.block_starts) else len(text)
+
+        starts, tokens, words = self.measure(text[start:end], start)
+        self.num_tokens += sum(tokens) - sum(self.block_tokens[first:last])
+        self.num_words += sum(words) - sum(self.block_words[first:last])
+        tail = self.block_starts[last:]
+        if delta:
+            tail = [position + delta for position in tail]
+        self.block_starts[first:] = starts + tail
+        self.block_tokens[first:last] = tokens
+        self.block_words[first:last] = words
+        self.text = text
+
+
+class TokenCountSignals(QObject):
+    finished = Signal(int, int, int, int)
+
+
+class TokenCountTask(QRunnable):
+    def __init__(self, counter, text, generation, signals):
+        super().__init__()
+        self.counter = counter
+        self.text = text
+        self.generation = generation
+        self.signals = signals
+
+    def run(self):
+        num_tokens, num_words, num_chars = self.counter.count(self.text)
+        self.signals.finished.emit(self.generation, num_tokens, num_words, num_chars)
+
+
+class DebouncedTokenCounter(QObject):
+    counted = Signal(str)
+
+    def __init__(self, get_text, delay=150, model="cl100k_base", parent=None):
+        super().__init__(parent)
+        self.get_text = get_text
+        self.model = model
+        self.counter = None
+        self.generation = 0
+        self.signals = TokenCountSignals()
+        self.signals.finished.connect(self.handle_finished)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.start_count)
+
+    def schedule(self):
+        self.timer.start()
+
+    def start_count(self):
+        if self.counter is None:
+            self.counter = TokenCounter(self.model)
+        self.generation += 1
+        self.pool.start(
+            TokenCountTask(self.counter, self.get_text(), self.generation, self.signals)
+        )
+
+    def handle_finished(self, generation, num_tokens, num_words, num_chars):
+        if generation == self.generation:
+            self.counted.emit(format_counts(num_tokens, num_words, num_chars))
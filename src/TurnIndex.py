@@ -0,0 +1,91 @@
+import numpy as np
+
+from Retrieval import DIMENSIONS, MIN_SCORE, TOKEN_BUDGET, TOP_K, hashed_features
+
+
+class TurnIndex:
+    def __init__(self, capacity=1024):
+        # Stored bucket-major so a query only reads the rows for the buckets
+        # its own words fall in, rather than every vector in full.
+        self.vectors = np.zeros((DIMENSIONS, capacity), dtype=np.float16)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.tokens = np.zeros(capacity, dtype=np.int32)
+        self.document_frequency = np.zeros(DIMENSIONS, dtype=np.int64)
+        self.rows = {}
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, turn_id):
+        return turn_id in self.rows
+
+    def idf(self):
+        return np.log((1.0 + self.count) / (1.0 + self.document_frequency)) + 1.0
+
+    def embed(self, text, idf=None):
+        # Turns are stored as plain term frequencies, since the idf keeps
+        # changing as turns are added; it only weights the query, so every
+        # stored vector is scored against the same weights.
+        vector = np.zeros(DIMENSIONS, dtype=np.float32)
+        for bucket, weight in hashed_features(text):
+            vector[bucket] += weight
+        if idf is not None:
+            vector *= idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def grow(self):
+        capacity = self.vectors.shape[1] * 2
+        vectors = np.zeros((DIMENSIONS, capacity), dtype=np.float16)
+        vectors[:, : self.count] = self.vectors[:, : self.count]
+        self.vectors = vectors
+        self.ids = np.resize(self.ids, capacity)
+        self.tokens = np.resize(self.tokens, capacity)
+
+    def insert(self, turn_id, tokens, vector):
+        if self.count == self.vectors.shape[1]:
+            self.grow()
+        row = self.count
+        self.vectors[:, row] = vector
+        self.ids[row] = turn_id
+        self.tokens[row] = tokens
+        self.rows[turn_id] = row
+        self.document_frequency += vector != 0
+        self.count += 1
+
+    def add(self, turn_id, tokens, text):
+        vector = self.embed(text).astype(np.float16)
+        self.insert(turn_id, tokens, vector)
+        return vector
+
+    def load(self, rows):
+        for turn_id, tokens, blob in rows:
+            self.insert(turn_id, tokens, np.frombuffer(blob, dtype=np.float16))
+
+    def select(self, text, token_budget=TOKEN_BUDGET, top_k=TOP_K, exclude=()):
+        # Best scoring turns first, skipping any that would overrun the budget.
+        if not self.count:
+            return [], 0
+        query = self.embed(text, self.idf())
+        buckets = np.flatnonzero(query)
+        if not len(buckets):
+            return [], 0
+        scores = query[buckets] @ self.vectors[buckets, : self.count].astype(
+            np.float32
+        )
+        k = min(top_k + len(exclude), self.count)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        chosen, used = [], 0
+        for row in best:
+            turn_id = int(self.ids[row])
+            if scores[row] < MIN_SCORE or turn_id in exclude:
+                continue
+            if used + self.tokens[row] > token_budget:
+                continue
+            chosen.append(turn_id)
+            used += int(self.tokens[row])
+            if len(chosen) == top_k:
+                break
+        return chosen, used
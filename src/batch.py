@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from Conversation import Conversation, Turn
+from InterfaceUtility import MODELS, TEMPERATURE, ChatModel
+from Metrics import MetricsRecorder
+from RateLimiter import RequestScheduler
+from TokenCounter import count_message_tokens, message_tokens
+
+
+def read_prompts(stream):
+    # Each line is either a JSON object with at least a "prompt" or plain text.
+    for number, line in enumerate(stream, 1):
+        line = line.rstrip("\n")
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            record = {"prompt": line}
+        record.setdefault("id", str(number))
+        record["id"] = str(record["id"])
+        yield record
+
+
+def finished_ids(path):
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash; the prompt is simply run again.
+                continue
+            if record.get("error") is None:
+                done.add(str(record["id"]))
+    return done
+
+
+def ends_with_newline(path):
+    with open(path, "rb") as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b"\n"
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        api_key,
+        output,
+        model="gpt-3.5-turbo",
+        temperature=TEMPERATURE,
+        concurrency=4,
+        rpm=None,
+        tpm=None,
+    ):
+        self.api_key = api_key
+        self.output = output
+        self.model = model
+        self.temperature = temperature
+        self.concurrency = concurrency
+        self.scheduler = RequestScheduler(rpm, tpm)
+        self.chat_model = ChatModel()
+        self.write_lock = threading.Lock()
+        self.metrics = MetricsRecorder()
+        self.latencies = []
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def run_one(self, record):
+        conversation = Conversation()
+        conversation.prepend(
+            [
+                Turn(
+                    None,
+                    user,
+                    assistant,
+                    message_tokens("user", user),
+                    message_tokens("assistant", assistant),
+                )
+                for user, assistant in record.get("history", [])
+            ]
+        )
+        conversation.ask(record["prompt"], message_tokens("user", record["prompt"]))
+        messages = self.chat_model.turn_context(conversation, window=len(conversation))
+        model = record.get("model", self.model)
+        temperature = record.get("temperature", self.temperature)
+        prompt_tokens = count_message_tokens(messages)
+        started = time.perf_counter()
+        result = {"id": record["id"], "prompt": record["prompt"], "model": model}
+        try:
+            response = self.scheduler.run(
+                lambda key: self.chat_model.create_completion(
+                    key or self.api_key, messages, model, temperature=temperature
+                ),
+                prompt_tokens,
+            )
+        except Exception as e:
+            result["error"] = str(e)
+            result["latency"] = time.perf_counter() - started
+            return result
+        self.scheduler.record_usage(prompt_tokens, response.usage.total_tokens)
+        result.update(
+            response=response.choices[0].message.content,
+            finish_reason=response.choices[0].finish_reason,
+            usage=dict(response.usage),
+            latency=time.perf_counter() - started,
+            error=None,
+        )
+        return result
+
+    def write(self, file, result):
+        with self.write_lock:
+            file.write(json.dumps(result) + "\n")
+            file.flush()
+
+    def run(self, records):
+        done = finished_ids(self.output)
+        pending = []
+        for record in records:
+            if record["id"] in done:
+                self.skipped += 1
+            else:
+                pending.append(record)
+
+        started = time.perf_counter()
+        with open(self.output, "a") as file, ThreadPoolExecutor(
+            self.concurrency
+        ) as executor:
+            if file.tell() and not ends_with_newline(self.output):
+                file.write("\n")
+            futures = [executor.submit(self.run_one, record) for record in pending]
+            for future in as_completed(futures):
+                result = future.result()
+                self.write(file, result)
+                self.latencies.append(result["latency"])
+                if result.get("error") is None:
+                    self.succeeded += 1
+                    self.prompt_tokens += result["usage"]["prompt_tokens"]
+                    self.completion_tokens += result["usage"]["completion_tokens"]
+                    self.metrics.record(
+                        result["model"],
+                        result["latency"],
+                        prompt_tokens=result["usage"]["prompt_tokens"],
+                        completion_tokens=result["usage"]["completion_tokens"],
+                    )
+                else:
+                    self.failed += 1
+                    self.metrics.record(result["model"], result["latency"], error=True)
+                    print(f"{result['id']}: {result['error']}", file=sys.stderr)
+        return time.perf_counter() - started
+
+    def summary(self, elapsed):
+        total_tokens = self.prompt_tokens + self.completion_tokens
+        minutes = elapsed / 60 if elapsed else 0
+        lines = [
+            f"Prompts: {self.succeeded} succeeded, {self.failed} failed, "
+            f"{self.skipped} already done",
+            f"Elapsed: {elapsed:.1f} s, waiting on rate limits: "
+            f"{self.scheduler.total_wait:.1f} s, retries: {self.scheduler.retries}",
+            f"Tokens: {self.prompt_tokens} prompt + {self.completion_tokens} completion",
+        ]
+        if minutes:
+            requests = self.succeeded + self.failed
+            lines.append(
+                f"Throughput: {requests / minutes:.1f} requests/min, "
+                f"{total_tokens / minutes:.0f} tokens/min"
+            )
+        if self.latencies:
+            lines.append(
+                f"Latency: median {statistics.median(self.latencies):.2f} s, "
+                f"max {max(self.latencies):.2f} s"
+            )
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run a file of prompts through the chat API without the GUI."
+    )
+    parser.add_argument(
+        "input", nargs="?", help="JSONL or plain-text prompts; stdin if omitted"
+    )
+    parser.add_argument("-o", "--output", required=True, help="JSONL results file")
+    parser.add_argument("--model", default=MODELS[0])
+    parser.add_argument("--temperature", type=float, default=TEMPERATURE)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rpm", type=int, help="Requests per minute limit")
+    parser.add_argument("--tpm", type=int, help="Tokens per minute limit")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"))
+    parser.add_argument(
+        "--metrics", help="Write request metrics to a .csv or Prometheus text file"
+    )
+    args = parser.parse_args()
+    if not args.api_key:
+        parser.error("Set OPENAI_API_KEY or pass --api-key.")
+
+    if args.input:
+        with open(args.input, "r") as file:
+            records = list(read_prompts(file))
+    else:
+        records = list(read_prompts(sys.stdin))
+
+    runner = BatchRunner(
+        args.api_key,
+        args.output,
+        args.model,
+        args.temperature,
+        args.concurrency,
+        args.rpm,
+        args.tpm,
+    )
+    elapsed = runner.run(records)
+    print(runner.summary(elapsed))
+    if args.metrics:
+        runner.metrics.export(args.metrics)
+    sys.exit(1 if runner.failed else 0)
@@ -1,28 +1,120 @@
-import json
 import os
 import sys
 
-import markdown2
-import tiktoken
-from PySide6.QtCore import Qt
-from PySide6.QtGui import (QAction, QFont, QFontDatabase, QIcon, QTextCursor,
-                           QTextOption)
-from PySide6.QtWidgets import (QApplication, QComboBox, QFileDialog,
-                               QHBoxLayout, QLabel, QMainWindow, QMenu,
-                               QMenuBar, QPushButton, QSplitter, QTabWidget,
-                               QTextBrowser, QTextEdit, QVBoxLayout, QWidget)
-
-from InterfaceUtility import ApiWindow, ChatInput, ChatModel
+from PySide6.QtCore import QThreadPool, QTimer
+from PySide6.QtGui import QAction, QFont, QFontDatabase, QIcon
+from PySide6.QtWidgets import (QApplication, QCheckBox, QDialog, QFileDialog,
+                               QHBoxLayout, QInputDialog, QLabel, QMainWindow,
+                               QMenu, QMenuBar, QTabBar, QTabWidget,
+                               QVBoxLayout, QWidget)
+
+from ChatWorker import WarmConnectionTask
+from ConversationSearch import SearchDialog, SearchIndexer
+from ConversationStore import ConversationStore
+from ConversationTab import ConversationTab
+from InterfaceUtility import ApiWindow, ChatModel
+from KeyPool import KeyPool
+from Metrics import MetricsPanel, MetricsRecorder
+from ModelComparison import ComparisonDialog, ComparisonRun
+from RawHistory import RawHistoryView
+from RateLimiter import RPM, TPM, RequestScheduler
+from ResponseCache import ResponseCache
+from Retrieval import RetrievalIndexer
+from Startup import StartupTimer, WarmupWorker
+from TokenCounter import message_tokens
+
+# Requests from every conversation tab share this many threads; the scheduler
+# still paces them to the account's rate limits.
+MAX_CONCURRENT_REQUESTS = 8
 
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.input_text_list = []
-        self.assistant_response = []
+        self.comparison_runs = []
+        self.released_tasks = set()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(MAX_CONCURRENT_REQUESTS)
+        self.response_cache = None
+        self.scheduler = RequestScheduler(RPM, TPM)
+        self.metrics = MetricsRecorder()
+        self.store = ConversationStore()
         self.init_ui()
         self.setWindowIcon(QIcon("img/icon.ico"))
         self.OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", None)
+        self.startup = None
+        self.warmup_worker = None
+        self.warmed_up = False
+        self.warmup_errors = []
+        self.search_indexer = None
+        self.retrieval_indexer = None
+        self.retrieval_index = None
+        self.unembedded_turns = []
+
+    def finish_startup(self, startup):
+        # Runs once the window is on screen: load the last conversation, then
+        # import and warm the heavy components in the background.
+        self.startup = startup
+        startup.mark("window shown")
+        self.conversation.open_session(self.store.latest_session())
+        startup.mark("conversation")
+        self.search_indexer = SearchIndexer(self.store.path, self)
+        self.search_indexer.finished.connect(self.search_indexed)
+        self.search_indexer.start()
+        self.retrieval_indexer = RetrievalIndexer(self.store.path, self)
+        self.retrieval_indexer.ready.connect(self.retrieval_ready)
+        self.retrieval_indexer.finished.connect(self.retrieval_indexed)
+        self.retrieval_indexer.start()
+        self.statusBar().showMessage("Loading...")
+        self.warmup_worker = WarmupWorker(parent=self)
+        self.warmup_worker.component_ready.connect(self.component_ready)
+        self.warmup_worker.failed.connect(self.warmup_failed)
+        self.warmup_worker.finished.connect(self.warmup_finished)
+        self.warmup_worker.start()
+
+    def component_ready(self, name, seconds):
+        self.startup.record(name, seconds)
+
+    def warmup_failed(self, name, message):
+        self.warmup_errors.append(f"Warm-up of {name} failed: {message}")
+
+    def warmup_finished(self):
+        self.startup.mark("ready")
+        self.statusBar().showMessage(
+            "; ".join([self.startup.summary(), *self.warmup_errors]), 10000
+        )
+        self.warmup_worker.deleteLater()
+        self.warmup_worker = None
+        self.warmed_up = True
+
+    def search_indexed(self):
+        self.search_indexer.deleteLater()
+        self.search_indexer = None
+
+    def retrieval_ready(self, index):
+        # Turns saved while the index was being built are embedded now.
+        self.retrieval_index = index
+        for turn in self.unembedded_turns:
+            self.embed_turn(*turn)
+        self.unembedded_turns = []
+
+    def retrieval_indexed(self):
+        self.retrieval_indexer.deleteLater()
+        self.retrieval_indexer = None
+
+    def closeEvent(self, event):
+        for conversation in self.conversations():
+            conversation.shutdown()
+        for run in self.comparison_runs:
+            run.cancel()
+        for worker in (self.search_indexer, self.retrieval_indexer):
+            if worker is not None:
+                worker.requestInterruption()
+                worker.wait()
+        # Cancelled requests stop at the next streamed chunk or retry wait;
+        # one stuck on a slow connection is not waited for indefinitely.
+        self.pool.waitForDone(5000)
+        super().closeEvent(event)
 
     def init_ui(self):
         fontdb = QFontDatabase()
@@ -62,129 +154,104 @@ class MainWindow(QMainWindow):
 
         self.create_menu()
 
-        self.model_dropdown = QComboBox()
-        self.model_dropdown.addItems(["gpt-3.5-turbo"])
-        self.model_dropdown.setEnabled(False)
-        self.current_model = self.model_dropdown.currentText()
-        self.main_layout.addWidget(self.model_dropdown)
-
-        self.context_label = QLabel("Number of messages to keep in context: ")
-        self.context_label.setToolTip(
-            "The number of messages to keep in context for the AI. \nThe more messages, the more context the AI has to work with, but the longer it takes to generate a response. \nThe default is 2 and is recommended for most use cases. Choice is reflected after pressing submit and is not retroactive."
-        )
-        self.context_label.toolTip
-        self.context_label.setFont(self.pil_font)
-        self.context_label.setAlignment(Qt.AlignRight)
-        self.main_layout.addWidget(self.context_label)
-
-        self.context_choice = QComboBox()
-        for i in range(0, 11):
-            self.context_choice.addItem(str(i))
-        self.context_choice.setCurrentIndex(2)
-        self.context_choice.setToolTip(self.context_label.toolTip())
-        self.main_layout.addWidget(self.context_choice)
-
-        self.splitter = QSplitter(Qt.Vertical)  # type: ignore
-
-        self.chat = QTextBrowser()
-        self.chat.setFont(self.response_font)
-        self.chat.setFontPointSize(11)
-        self.chat.setPlaceholderText("Your assistant's response will appear here")
-        self.chat.setAcceptRichText(True)
-        self.chat.setWordWrapMode(QTextOption.WrapAtWordBoundaryOrAnywhere)
-        self.chat.setReadOnly(True)
-        self.splitter.addWidget(self.chat)
-
-        self.size_button_widget = QWidget()
-        self.size_button_layout = QHBoxLayout()
-        self.size_button_layout.setAlignment(Qt.AlignRight)
-        self.minus_button = QPushButton("-")
-        self.minus_button.setFixedWidth(30)
-        self.plus_button = QPushButton("+")
-        self.plus_button.setFixedWidth(30)
-        self.plus_button.clicked.connect(self.increase_font_size)
-        self.minus_button.clicked.connect(self.decrease_font_size)
-        self.size_button_layout.addWidget(self.minus_button)
-        self.size_button_layout.addWidget(self.plus_button)
-        self.size_button_widget.setLayout(self.size_button_layout)
-        self.splitter.addWidget(self.size_button_widget)
-
-        self.input_text_edit = ChatInput(self.submit_text)
-        self.input_text_edit.setFont(self.input_text_font)
-        self.input_text_edit.setPlaceholderText("Enter your text here")
-        self.input_text_edit.textChanged.connect(self.parse_text)  # type: ignore
-        self.input_text_edit.setAcceptRichText(False)
-        self.splitter.addWidget(self.input_text_edit)
-
-        self.parsed_info_label = QLabel(
-            f"Token Counts are estimated with Tiktoken and don't include special tokens or tokens added by the model and its response"
-        )
-        self.parsed_info_label.setWordWrap(True)
-        self.parsed_info_label.setFont(self.pil_font)
-        self.splitter.addWidget(self.parsed_info_label)
-
         self.tab_widget = QTabWidget()
-        self.first_tab_widget = QWidget()
-        self.first_tab_layout = QVBoxLayout()
-        self.first_tab_layout.addWidget(self.splitter)
-        self.splitter.setSizes([600, 10, 210, 80])
-
-        self.bottom_layout = QHBoxLayout()
-        self.submit_button = QPushButton("Submit")
-        self.bottom_layout.addWidget(self.submit_button)
-
-        self.submit_button.clicked.connect(self.submit_text)  # type: ignore
-        self.submit_button.setAutoDefault(True)
-        self.submit_button.setShortcut("Ctrl+Enter")
-        self.submit_button.keyPressEvent = self.submit_text  # type: ignore
-
-        self.first_tab_layout.addLayout(self.bottom_layout)
-        self.first_tab_widget.setLayout(self.first_tab_layout)
-        self.tab_widget.addTab(self.first_tab_widget, self.model_dropdown.currentText())
-
-        self.history = QTextEdit()
-
-        self.history.setFont(self.history_font)
-        self.history.setReadOnly(True)
-        self.history.setPlaceholderText(
-            "Your assistant's raw responses will appear here"
-        )
+        self.conversation = ConversationTab(self)
+        self.tab_widget.addTab(self.conversation, self.conversation.current_model)
+
+        self.history_view = RawHistoryView(self.conversation.history, self.history_font)
 
         self.second_tab_widget = QWidget()
         self.second_tab_layout = QVBoxLayout()
-        self.second_tab_layout.addWidget(self.history)
+        self.second_tab_layout.addWidget(self.history_view)
         self.second_tab_widget.setLayout(self.second_tab_layout)
         self.tab_widget.addTab(self.second_tab_widget, "Raw History")
-
+        self.metrics_panel = MetricsPanel(self.metrics)
+        self.tab_widget.addTab(self.metrics_panel, "Metrics")
+        self.tab_widget.currentChanged.connect(self.tab_changed)  # type: ignore
+        self.tab_widget.setTabsClosable(True)
+        for index in range(1, self.tab_widget.count()):
+            self.tab_widget.tabBar().setTabButton(index, QTabBar.RightSide, None)
+        self.tab_widget.tabCloseRequested.connect(self.close_tab)  # type: ignore
         self.main_layout.addWidget(self.tab_widget)
+
+        # The response cache and the rate limits are shared by every tab.
+        self.shared_layout = QHBoxLayout()
+        self.cache_checkbox = QCheckBox("Cache")
+        self.cache_checkbox.setToolTip(
+            "Answer repeated prompts from a local cache instead of calling the API again."
+        )
+        self.cache_checkbox.toggled.connect(self.toggle_cache)  # type: ignore
+        self.shared_layout.addWidget(self.cache_checkbox)
+
+        self.cache_label = QLabel()
+        self.cache_label.setFont(self.pil_font)
+        self.shared_layout.addWidget(self.cache_label)
+
+        self.scheduler_label = QLabel()
+        self.scheduler_label.setFont(self.pil_font)
+        self.scheduler_label.setToolTip(
+            f"Requests are paced to {RPM} requests and {TPM} tokens per minute "
+            "(OPENAI_RPM and OPENAI_TPM) and retried with backoff on rate limits."
+        )
+        self.shared_layout.addWidget(self.scheduler_label, 1)
+        self.scheduler_timer = QTimer(self)
+        self.scheduler_timer.setInterval(500)
+        self.scheduler_timer.timeout.connect(self.update_scheduler_label)  # type: ignore
+        self.scheduler_timer.start()
+
+        self.main_layout.addLayout(self.shared_layout)
         self.central_widget.setLayout(self.main_layout)
 
-    def increase_font_size(self):
-        # Get the current font size and increase it by 1
-        current_size = self.chat.fontPointSize()
-        self.chat.setVisible(False)
-        self.chat.selectAll()
-        new_size = current_size + 1
-        # Set the new font size for the QTextEdit widget
-        font = self.chat.currentFont()
-        font.setPointSize(int(new_size))
-        self.chat.setCurrentFont(font)
-        self.chat.moveCursor(QTextCursor.End)
-        self.chat.setVisible(True)
-
-    def decrease_font_size(self):
-        # Get the current font size and decrease it by 1
-        current_size = self.chat.fontPointSize()
-        self.chat.setVisible(False)
-        self.chat.selectAll()
-        new_size = current_size - 1 if current_size >= 1 else 1
-        # Set the new font size for the QTextEdit widget
-        font = self.chat.currentFont()
-        font.setPointSize(int(new_size))
-        self.chat.setCurrentFont(font)
-        self.chat.setCurrentFont(font)
-        self.chat.moveCursor(QTextCursor.End)
-        self.chat.setVisible(True)
+    def conversations(self):
+        for index in range(self.tab_widget.count()):
+            widget = self.tab_widget.widget(index)
+            if isinstance(widget, ConversationTab):
+                yield widget
+
+    def find_conversation(self, session_id):
+        for conversation in self.conversations():
+            if conversation.session_id == session_id:
+                return conversation
+        return None
+
+    def new_conversation(self, model=None):
+        # Conversation tabs sit together ahead of Raw History and Metrics.
+        conversation = ConversationTab(self, model or self.conversation.current_model)
+        index = self.tab_widget.insertTab(
+            len(list(self.conversations())), conversation, conversation.current_model
+        )
+        self.tab_widget.setCurrentIndex(index)
+        return conversation
+
+    def conversation_for(self, session_id):
+        # Reuses the tab already showing the session, then an empty current
+        # tab, before opening a new one.
+        conversation = self.find_conversation(session_id)
+        if conversation is None:
+            if self.conversation.is_empty():
+                conversation = self.conversation
+            else:
+                conversation = self.new_conversation()
+            conversation.open_session(session_id)
+        self.tab_widget.setCurrentWidget(conversation)
+        return conversation
+
+    def update_tab(self, conversation):
+        index = self.tab_widget.indexOf(conversation)
+        if index >= 0:
+            self.tab_widget.setTabText(index, conversation.current_model)
+
+    def tab_changed(self, index):
+        widget = self.tab_widget.widget(index)
+        if isinstance(widget, ConversationTab):
+            self.conversation = widget
+            self.history_view.set_model(widget.history)
+        self.refresh_metrics()
+
+    def release_task(self, task):
+        self.released_tasks.add(task)
+        task.signals.completed.connect(lambda _: self.released_tasks.discard(task))
+        task.signals.failed.connect(lambda _: self.released_tasks.discard(task))
 
     def create_menu(self):
         menu_bar = QMenuBar(self)
@@ -200,12 +267,24 @@ class MainWindow(QMainWindow):
             parent.addAction(action)
 
         # Menu one items
+        self.new_chat_action = add_menu_action(
+            file_menu, "&New Chat", "Ctrl+T", self.new_chat
+        )
+        self.open_chat_action = add_menu_action(
+            file_menu, "&Open Chat", "Ctrl+O", self.open_chat
+        )
         self.save_chat_action = add_menu_action(
             file_menu, "&Save Chat", "Ctrl+S", self.save_chat
         )
+        self.attach_file_action = add_menu_action(
+            file_menu, "Attach &File", "Ctrl+Shift+A", self.attach_file
+        )
         self.export_history_action = add_menu_action(
             file_menu, "&Export History", "Ctrl+E", self.export_history
         )
+        self.compare_models_action = add_menu_action(
+            file_menu, "C&ompare Models", "Ctrl+K", self.compare_models
+        )
         self.api_key_option = add_menu_action(
             file_menu, "&API Key Manager", "Ctrl+M", self.api_key_manager
         )
@@ -228,114 +307,203 @@ class MainWindow(QMainWindow):
         self.clear_chat_action = add_menu_action(
             edit_menu, "&Clear Chat", "Ctrl+W", self.clear_chat
         )
+        self.search_action = add_menu_action(
+            edit_menu, "Search C&onversations", "Ctrl+F", self.search_conversations
+        )
+
+    def new_chat(self):
+        self.new_conversation()
 
     def save_chat(self):
-        file_path, _ = QFileDialog.getSaveFileName(
-            self, "Save Chat", ".MD", "MD Files (*.MD);;All Files (*)"
+        self.conversation.save_chat()
+
+    def attach_file(self):
+        self.conversation.attach_file()
+
+    def open_chat(self):
+        sessions = self.store.list_sessions()
+        if not sessions:
+            return
+        titles = [session["title"] for session in sessions]
+        title, ok = QInputDialog.getItem(
+            self, "Open Chat", "Conversation:", titles, 0, False
         )
+        if ok:
+            self.conversation_for(sessions[titles.index(title)]["id"])
 
-        if file_path:
-            with open(file_path, "w") as file:
-                file.write(self.chat.toMarkdown())
+    def search_conversations(self):
+        dialog = SearchDialog(self.store, self)
+        dialog.turn_selected.connect(self.show_turn)
+        if self.search_indexer is not None:
+            self.search_indexer.progress.connect(dialog.show_progress)
+        dialog.exec()
+
+    def show_turn(self, session_id, turn_id):
+        self.conversation_for(session_id).show_turn(turn_id)
 
     def export_history(self):
         file_path, _ = QFileDialog.getSaveFileName(
             self, "Export Raw History", ".json", "JSON Files (*.json);;All Files (*)"
         )
         if file_path:
-            with open(file_path, "w") as file:
-                file.write(self.history.toPlainText())
+            self.conversation.history.export(file_path)
 
     def api_key_manager(self):
-        get_key = ApiWindow(self).key
-        self.OPENAI_API_KEY = get_key
+        manager = ApiWindow(self, self.scheduler.keys)
+        self.OPENAI_API_KEY = manager.key
+        if manager.keys:
+            self.use_keys(manager.keys)
+
+    def use_keys(self, keys):
+        # Several keys are pooled, each with its own RPM/TPM budget; with
+        # one key the shared limiter is enough.
+        if len(keys) < 2:
+            self.scheduler.keys = None
+        elif self.scheduler.keys is None:
+            self.scheduler.keys = KeyPool(keys, RPM, TPM)
+        else:
+            self.scheduler.keys.set_keys(keys)
 
     def copy_text(self):
-        self.input_text_edit.copy()
+        self.conversation.input_text_edit.copy()
 
     def paste_text(self):
-        self.input_text_edit.paste()
+        self.conversation.input_text_edit.paste()
 
     def cut_text(self):
-        self.input_text_edit.cut()
+        self.conversation.input_text_edit.cut()
 
     def select_all_text(self):
-        self.input_text_edit.selectAll()
+        self.conversation.input_text_edit.selectAll()
 
     def clear_chat(self):
-        self.input_text_list = []
-        self.assistant_response = []
-        self.history.clear()
-        self.chat.clear()
-
-    def parse_text(self):
-        input_text = self.input_text_edit.toPlainText()
-        parsed_info = self.parse_information(input_text)
-        self.parsed_info_label.setText(parsed_info)
-
-    @staticmethod
-    def parse_information(text, model="cl100k_base"):
-        encoding = tiktoken.get_encoding(model)
-        assert encoding.decode(encoding.encode(text)) == text
-        num_tokens = len(encoding.encode(text))
-        return f"Token count: {num_tokens}\tWord count: {len(text.split())},\tCharacter count: {len(text)}"
-
-    def submit_text(self):
-        if (
-            self.input_text_edit.toPlainText() == ""
-            or self.input_text_edit.toPlainText() == " "
-        ):
+        self.conversation.clear_chat()
+
+    def warm_connections(self):
+        # Every pooled key may take the next request, so each gets warmed.
+        # Until the warm-up worker has imported the API client, a keystroke
+        # would import openai and requests here, on the GUI thread.
+        if not self.warmed_up:
             return
+        from ApiClient import get_client
+
+        if self.scheduler.keys:
+            keys = list(self.scheduler.keys.keys)
+        elif self.OPENAI_API_KEY:
+            keys = [self.OPENAI_API_KEY]
+        else:
+            return
+        for key in keys:
+            client = get_client(key)
+            if client.start_warming():
+                self.pool.start(WarmConnectionTask(client))
+
+    def ensure_api_key(self):
         if self.OPENAI_API_KEY == "" or self.OPENAI_API_KEY is None:
             run_api_key_manager = ApiWindow()
             self.OPENAI_API_KEY = run_api_key_manager.result()
+            if run_api_key_manager.keys:
+                self.use_keys(run_api_key_manager.keys)
+        if self.OPENAI_API_KEY == "" or self.OPENAI_API_KEY is None:
+            ChatModel.show_error()
+            return False
+        return True
+
+    def compare_models(self):
+        conversation = self.conversation
+        prompt = conversation.input_text_edit.toPlainText()
+        if prompt.strip() == "" or not self.ensure_api_key():
+            return
+        if conversation.task is not None:
+            # The context is built by adding the prompt as the newest turn,
+            # which only works while no answer is outstanding.
+            self.statusBar().showMessage(
+                "Wait for the current answer before comparing models", 5000
+            )
+            return
+        dialog = ComparisonDialog(conversation.current_model, self)
+        if dialog.exec() != QDialog.Accepted or not dialog.variants():
+            return
 
-        self.input_text_list.append(self.input_text_edit.toPlainText())
-        self.num_contexts = self.context_choice.currentIndex() + 1
+        chat_model = ChatModel()
+        conversation.turns.ask(prompt, message_tokens("user", prompt))
+        messages = conversation.build_messages()
+        conversation.turns.retract()
 
-        response = ChatModel().submit_text(
+        run = ComparisonRun(
+            chat_model,
             self.OPENAI_API_KEY,
-            self.input_text_list[-1 * self.num_contexts :],
-            self.assistant_response[-1 * (self.num_contexts - 1) :],
+            messages,
+            dialog.variants(),
+            dialog.max_workers.value(),
+            conversation.stream_checkbox.isChecked(),
+            self,
+            self.scheduler,
+            self.metrics,
         )
-        print(response)
-
-        self.assistant_response.append(response.choices[0].message.content)
-        token_usage = self.token_count(response)
-        self.parse_response(response, token_usage)
-        self.history.append(json.dumps(response, indent=4))
-        if self.OPENAI_API_KEY == "" or self.OPENAI_API_KEY is None:
-            self.assistant_response.append("API Key was not set.")
-            self.parse_response(response, "")
+        for pane in run.panes:
+            index = self.tab_widget.addTab(pane, f"{pane.model} @ {pane.temperature}")
+        self.tab_widget.setCurrentIndex(index - len(run.panes) + 1)
+        run.finished.connect(lambda: self.comparison_finished(run))
+        self.comparison_runs.append(run)
+        conversation.stop_button.setEnabled(True)
+        run.start()
+
+    def comparison_finished(self, run):
+        self.comparison_runs.remove(run)
+        run.deleteLater()
+        self.refresh_metrics()
+        if not self.comparison_runs:
+            for conversation in self.conversations():
+                if conversation.task is None:
+                    conversation.stop_button.setEnabled(False)
+
+    def close_tab(self, index):
+        # Raw History and Metrics stay, as does the last conversation;
+        # other conversations and comparison tabs can be closed.
+        widget = self.tab_widget.widget(index)
+        if widget is self.second_tab_widget or widget is self.metrics_panel:
             return
-        self.input_text_edit.clear()
-
-
-    def parse_response(self, response, token_usage):
-        print(self.input_text_list[-1])
-        print(self.assistant_response[-1])
-        markdown = self.chat.toMarkdown() if self.chat.toMarkdown() else ""
-        markdown = markdown + (f"####{self.input_text_list[-1]}\n")
-        markdown = markdown + ("___" + "\n<br>\n")
-        markdown = markdown + (f"{self.assistant_response[-1]}\n")
-        markdown = markdown + ("\n<br>\n")
-        markdown = markdown + (token_usage)
-        markdown = markdown + ("___" + "\n<br>\n<br>\n")
-        html_text = markdown2.markdown(markdown)
-        self.chat.setHtml(html_text)
-        self.chat.moveCursor(QTextCursor.End)
-
-    def token_count(self, response):
-        # Get usage information from the API response
-        completion_tokens = response.usage.completion_tokens
-        prompt_tokens = response.usage.prompt_tokens
-        total_tokens = response.usage.total_tokens
-        token_usage = f"Completion tokens: {completion_tokens}\tPrompt tokens: {prompt_tokens}\nTotal tokens: {total_tokens}\n"
-        return token_usage
+        if isinstance(widget, ConversationTab):
+            if len(list(self.conversations())) == 1:
+                return
+            widget.shutdown()
+        self.tab_widget.removeTab(index)
+        if widget is self.conversation:
+            # The neighbouring tab Qt switched to was not a conversation.
+            self.tab_widget.setCurrentWidget(next(self.conversations()))
+        widget.deleteLater()
+
+    def update_scheduler_label(self):
+        text = self.scheduler.stats_text()
+        if text != self.scheduler_label.text():
+            self.scheduler_label.setText(text)
+
+    def toggle_cache(self, enabled):
+        if enabled and self.response_cache is None:
+            self.response_cache = ResponseCache()
+            self.cache_label.setText(self.response_cache.stats_text())
+        elif not enabled and self.response_cache is not None:
+            self.response_cache.close()
+            self.response_cache = None
+            self.cache_label.setText("")
+
+    def refresh_metrics(self):
+        if self.tab_widget.currentWidget() is self.metrics_panel:
+            self.metrics_panel.refresh()
+
+    def embed_turn(self, turn_id, tokens, text):
+        if self.retrieval_index is None:
+            self.unembedded_turns.append((turn_id, tokens, text))
+        elif turn_id not in self.retrieval_index:
+            vector = self.retrieval_index.add(turn_id, tokens, text)
+            self.store.save_vectors([(turn_id, vector.tobytes())])
 
 
 if __name__ == "__main__":
+    startup = StartupTimer()
     app = QApplication(sys.argv)
+    startup.mark("Qt application")
     color_scheme = {
         "primary": "#95a5a6",
         "secondary": "#1c1c24",
@@ -369,7 +537,9 @@ if __name__ == "__main__":
     main_window = MainWindow()
     main_window.setWindowTitle("OpenAI API - GPT3.5-Turbo")
     main_window.setGeometry(400, 100, 600, 900)
+    startup.mark("main window")
 
     main_window.show()
+    QTimer.singleShot(0, lambda: main_window.finish_startup(startup))
 
     sys.exit(app.exec())